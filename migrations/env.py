@@ -7,6 +7,8 @@ from flask import current_app
 
 from alembic import context
 
+from search import is_search_object
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -38,6 +40,14 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_name(name, type_, parent_names):
+    # Keeps autogenerate from dropping what no model maps: the name search tables and indexes
+    # (search.py) and SQLite's own tables, such as sqlite_stat1 once flask seed has run ANALYZE
+    if type_ in ('table', 'index'):
+        return not (is_search_object(name) or name.startswith('sqlite_'))
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -52,7 +62,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_name=include_name
     )
 
     with context.begin_transaction():
@@ -80,15 +91,32 @@ def run_migrations_online():
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
+        # SQLite batch operations rebuild a table by dropping it, which fails on the rows
+        # referencing it while foreign keys are enforced. The pragma is a no-op inside a
+        # transaction, so it is turned off before the migration starts and the references
+        # are checked before it commits
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
+            include_name=include_name,
             process_revision_directives=process_revision_directives,
             **current_app.extensions['migrate'].configure_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+                if sqlite:
+                    violations = connection.exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+                    if violations:
+                        raise RuntimeError('Migration left rows with dangling foreign keys: %s' % violations)
+        finally:
+            if sqlite:
+                connection.exec_driver_sql("PRAGMA foreign_keys=ON")
 
 
 if context.is_offline_mode():
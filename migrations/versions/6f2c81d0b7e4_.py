@@ -0,0 +1,38 @@
+"""unique favourite pairs
+
+Revision ID: 6f2c81d0b7e4
+Revises: 4a9d450bf541
+Create Date: 2026-10-17 10:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2c81d0b7e4'
+down_revision = '4a9d450bf541'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the oldest row of every duplicated pair so the constraints can be created
+    op.execute("DELETE FROM favourite_persons WHERE id NOT IN "
+               "(SELECT id FROM (SELECT MIN(id) AS id FROM favourite_persons GROUP BY user_id, person_id) AS keep)")
+    op.execute("DELETE FROM favourite_planets WHERE id NOT IN "
+               "(SELECT id FROM (SELECT MIN(id) AS id FROM favourite_planets GROUP BY user_id, planet_id) AS keep)")
+
+    with op.batch_alter_table('favourite_persons', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_favourite_persons_user_person', ['user_id', 'person_id'])
+
+    with op.batch_alter_table('favourite_planets', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_favourite_planets_user_planet', ['user_id', 'planet_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('favourite_planets', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_favourite_planets_user_planet', type_='unique')
+
+    with op.batch_alter_table('favourite_persons', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_favourite_persons_user_person', type_='unique')
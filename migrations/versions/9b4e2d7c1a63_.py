@@ -0,0 +1,42 @@
+"""favourite counters on persons and planets
+
+Revision ID: 9b4e2d7c1a63
+Revises: e1a7f4c95b32
+Create Date: 2026-10-17 13:10:42.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e2d7c1a63'
+down_revision = 'e1a7f4c95b32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('persons', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('favourite_count', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('favourite_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from the favourite tables, each count is one lookup in the ix_favourite_*_id indexes
+    op.execute("UPDATE persons SET favourite_count = "
+               "(SELECT COUNT(*) FROM favourite_persons WHERE favourite_persons.person_id = persons.id)")
+    op.execute("UPDATE planets SET favourite_count = "
+               "(SELECT COUNT(*) FROM favourite_planets WHERE favourite_planets.planet_id = planets.id)")
+
+    # /persons/top and /planets/top read the end of these indexes
+    op.create_index('ix_persons_favourite_count', 'persons', ['favourite_count', 'id'], unique=False)
+    op.create_index('ix_planets_favourite_count', 'planets', ['favourite_count', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_planets_favourite_count', table_name='planets')
+    op.drop_index('ix_persons_favourite_count', table_name='persons')
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.drop_column('favourite_count')
+    with op.batch_alter_table('persons', schema=None) as batch_op:
+        batch_op.drop_column('favourite_count')
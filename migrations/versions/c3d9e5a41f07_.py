@@ -0,0 +1,29 @@
+"""index foreign key columns
+
+Revision ID: c3d9e5a41f07
+Revises: 6f2c81d0b7e4
+Create Date: 2026-10-17 11:02:19.336470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d9e5a41f07'
+down_revision = '6f2c81d0b7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # favourite_*.user_id already leads the (user_id, ...) unique indexes from 6f2c81d0b7e4
+    op.create_index(op.f('ix_persons_planet_id'), 'persons', ['planet_id'], unique=False)
+    op.create_index(op.f('ix_favourite_persons_person_id'), 'favourite_persons', ['person_id'], unique=False)
+    op.create_index(op.f('ix_favourite_planets_planet_id'), 'favourite_planets', ['planet_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_favourite_planets_planet_id'), table_name='favourite_planets')
+    op.drop_index(op.f('ix_favourite_persons_person_id'), table_name='favourite_persons')
+    op.drop_index(op.f('ix_persons_planet_id'), table_name='persons')
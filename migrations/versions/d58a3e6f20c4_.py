@@ -0,0 +1,51 @@
+"""trigram name search indexes
+
+Revision ID: d58a3e6f20c4
+Revises: 9b4e2d7c1a63
+Create Date: 2026-10-17 13:41:07.502817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd58a3e6f20c4'
+down_revision = '9b4e2d7c1a63'
+branch_labels = None
+depends_on = None
+
+TABLES = ('persons', 'planets')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table in TABLES:
+            op.execute("CREATE INDEX ix_%s_name_trgm ON %s USING gin (lower(name) gin_trgm_ops)" % (table, table))
+    elif dialect == 'sqlite':
+        # Same statements as search.SQLITE_SEARCH_DDL; the rebuild indexes the existing names
+        for table in TABLES:
+            op.execute("CREATE VIRTUAL TABLE %s_search USING fts5"
+                       "(name, content='%s', content_rowid='id', tokenize='trigram')" % (table, table))
+            op.execute("CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+                       "INSERT INTO {table}_search(rowid, name) VALUES (new.id, new.name); END".format(table=table))
+            op.execute("CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN "
+                       "INSERT INTO {table}_search({table}_search, rowid, name) VALUES ('delete', old.id, old.name); END"
+                       .format(table=table))
+            op.execute("CREATE TRIGGER {table}_search_update AFTER UPDATE OF name ON {table} BEGIN "
+                       "INSERT INTO {table}_search({table}_search, rowid, name) VALUES ('delete', old.id, old.name); "
+                       "INSERT INTO {table}_search(rowid, name) VALUES (new.id, new.name); END".format(table=table))
+            op.execute("INSERT INTO {table}_search({table}_search) VALUES ('rebuild')".format(table=table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'postgresql':
+            op.execute("DROP INDEX ix_%s_name_trgm" % table)
+        elif dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute("DROP TRIGGER %s_search_%s" % (table, trigger))
+            op.execute("DROP TABLE %s_search" % table)
@@ -0,0 +1,32 @@
+"""table version counters for ETags
+
+Revision ID: e1a7f4c95b32
+Revises: c3d9e5a41f07
+Create Date: 2026-10-17 12:26:05.914582
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a7f4c95b32'
+down_revision = 'c3d9e5a41f07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_versions = op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_versions, [
+        {'name': name, 'version': 1}
+        for name in ('users', 'persons', 'planets', 'favourite_persons', 'favourite_planets')
+    ])
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,36 @@
+"""lower(name) indexes for prefix search matches
+
+Revision ID: f4b7d1e9c2a5
+Revises: d58a3e6f20c4
+Create Date: 2026-10-17 15:02:18.940611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b7d1e9c2a5'
+down_revision = 'd58a3e6f20c4'
+branch_labels = None
+depends_on = None
+
+TABLES = ('persons', 'planets')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'postgresql':
+            # text_pattern_ops serves LIKE 'q%' whatever the database collation
+            op.execute("CREATE INDEX ix_%s_name_lower ON %s (lower(name) text_pattern_ops)" % (table, table))
+        elif dialect == 'sqlite':
+            # Same statement as search.SQLITE_SEARCH_DDL
+            op.execute("CREATE INDEX ix_%s_name_lower ON %s (lower(name))" % (table, table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect in ('postgresql', 'sqlite'):
+            op.execute("DROP INDEX ix_%s_name_lower" % table)
@@ -1,20 +1,74 @@
 import os
+from flask import g
 from flask_admin import Admin
-from models import db, Users, Planets, Persons, Favourite_persons, Favourite_planets
+from sqlalchemy import inspect
+from cache import cache
+from models import db, add_favourites
 from flask_admin.contrib.sqla import ModelView
 
-def setup_admin(app):
+
+class ResourceView(ModelView):
+    """Admin of the model behind an API resource. Its writes keep what the resource's routes keep:
+    the favourite_count of the rows a favourite points at (Resource.counters), in the same
+    transaction, and the cached payloads showing the row before and after the change."""
+    # Maintained by the favourite writes, and favourites are edited in their own views, where
+    # the counters follow, not as collections of the rows they point at
+    form_excluded_columns = ('favourite_count', 'favourite_of', 'person_favourites', 'planet_favourites')
+
+    def __init__(self, resource, session, **kwargs):
+        self.resource = resource
+        super().__init__(resource.model, session, **kwargs)
+
+    def on_model_change(self, form, model, is_created):
+        old = previous_values(model)
+        # The form sets relationships, their foreign key columns (and a new row's id) follow at the flush
+        self.session.flush()
+        new = column_values(model)
+        for field, counted in self.resource.counters.items():
+            if old.get(field) != new[field]:
+                if old.get(field) is not None:
+                    add_favourites(self.session, counted, old[field], -1)
+                if new[field] is not None:
+                    add_favourites(self.session, counted, new[field], 1)
+        g.admin_entities = self.resource.entities(old) + self.resource.entities(new)
+
+    def after_model_change(self, form, model, is_created):
+        cache.invalidate(*g.pop('admin_entities', ()))
+
+    def on_model_delete(self, model):
+        row = column_values(model)
+        for field, counted in self.resource.counters.items():
+            if row[field] is not None:
+                add_favourites(self.session, counted, row[field], -1)
+        g.admin_entities = self.resource.entities(row)
+
+    def after_model_delete(self, model):
+        cache.invalidate(*g.pop('admin_entities', ()))
+
+
+def column_values(model):
+    return {column.key: getattr(model, column.key) for column in inspect(model).mapper.column_attrs}
+
+
+def previous_values(model):
+    # The columns as stored before the instance's pending changes; nothing for a new row
+    state = inspect(model)
+    if not state.has_identity:
+        return {}
+    values = column_values(model)
+    for key in values:
+        history = state.attrs[key].history
+        if history.deleted:
+            values[key] = history.deleted[0]
+    return values
+
+
+def setup_admin(app, resources):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
-    # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(Users, db.session))
-    admin.add_view(ModelView(Planets, db.session))
-    admin.add_view(ModelView(Persons, db.session))
-    admin.add_view(ModelView(Favourite_persons, db.session))
-    admin.add_view(ModelView(Favourite_planets, db.session))
 
-    # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # One view per API resource, so admin writes go through the same bookkeeping as the API's
+    for resource in resources:
+        admin.add_view(ResourceView(resource, db.session))
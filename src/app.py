@@ -2,13 +2,22 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
+from flask import Flask, Response, jsonify, url_for
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from utils import APIException, generate_sitemap, page_args, paginate, conditional, query_budget, search_args
 from admin import setup_admin
+from commands import setup_commands
+from cache import cache
+from search import search_page
+from json_provider import FastJSONProvider
+from compression import Compress
+from db_config import setup_database, database_diagnostics
+from replicas import replicas
+from metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from models import db, Users, Planets, Persons, Favourite_persons, Favourite_planets
+from resources import Resource, register_resources
 #from models import Person
 
 app = Flask(__name__)
@@ -20,522 +29,264 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['DEFAULT_PAGE_SIZE'] = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+app.config['MAX_PAGE_SIZE'] = int(os.getenv("MAX_PAGE_SIZE", 1000))
+app.config['STREAM_BATCH_SIZE'] = int(os.getenv("STREAM_BATCH_SIZE", 500))
+app.config['MAX_BULK_SIZE'] = int(os.getenv("MAX_BULK_SIZE", 5000))
+# ?ids= batch fetch cap, at most readmodels.IN_CHUNK keeps it to one IN query
+app.config['BATCH_MAX_IDS'] = int(os.getenv("BATCH_MAX_IDS", 500))
+app.config['CACHE_BACKEND'] = os.getenv("CACHE_BACKEND", "memory")
+app.config['CACHE_TTL'] = int(os.getenv("CACHE_TTL", 60))
+app.config['CACHE_MAXSIZE'] = int(os.getenv("CACHE_MAXSIZE", 10000))
+app.config['CACHE_REDIS_URL'] = os.getenv("CACHE_REDIS_URL")
+app.config['JSON_ENCODER'] = os.getenv("JSON_ENCODER", "auto")
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+replica_url = os.getenv("DATABASE_REPLICA_URL")
+if replica_url:
+    app.config['DATABASE_REPLICA_URL'] = replica_url.replace("postgres://", "postgresql://")
+app.config['REPLICA_STICKY_SECONDS'] = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+app.config['REPLICA_CHECK_SECONDS'] = int(os.getenv("REPLICA_CHECK_SECONDS", 10))
+app.config['METRICS_ENABLED'] = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+app.config['SERVER_TIMING'] = os.getenv("SERVER_TIMING", "false").lower() == "true"
+# raise, log or off; unset raises in debug/testing and logs in production
+app.config['QUERY_BUDGET_MODE'] = os.getenv("QUERY_BUDGET_MODE")
+app.config['CACHE_CONTROL'] = {
+    resource: os.getenv("CACHE_CONTROL_" + resource.upper(), "no-cache")
+    for resource in ('users', 'persons', 'planets', 'favourite_persons', 'favourite_planets')
+}
+
+app.json = FastJSONProvider(app)
 
 MIGRATE = Migrate(app, db)
-db.init_app(app)
+setup_database(app, db)
+replicas.init_app(app, db)
+cache.init_app(app)
 CORS(app)
-setup_admin(app)
+Compress(app)
+metrics.init_app(app)
+setup_commands(app)
 
-# Handle/serialize errors like a JSON object
+# Handle/serialize errors like a JSON object, encoded by app.json like every other response
 @app.errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
 # generate sitemap with all your endpoints
 @app.route('/')
+@query_budget(0)
 def sitemap():
     return generate_sitemap(app)
 
-
-# _________________________________________USER_________________________________________
-
-@app.route('/users', methods=['GET'])  # _____GET_____
-def get_users():
+# active engine profile (pool, pragmas, timeouts) as the database reports it, and replica health
+@app.route('/diagnostics/db', methods=['GET'])
+@query_budget(5)
+def db_diagnostics():
     try:
-        data = Users.query.all()
-        data = [user.serialize() for user in data]
+        diagnostics = database_diagnostics(db)
+        if replicas.enabled:
+            diagnostics['replica'] = replicas.status()
+        return jsonify(diagnostics), 200
 
-        return jsonify({"msg": "GET User", "data": data}), 200
-    
     except Exception as e:
-        return jsonify({"msg": "Error in GET Users", "error": str(e)}), 500
-    
+        return jsonify({"msg": "Error in GET DB Diagnostics", "error": str(e)}), 500
+
+# request latency and SQL statements per endpoint, Prometheus text format
+@app.route('/metrics', methods=['GET'])
+@query_budget(0)
+def get_metrics():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 
-@app.route('/users/<int:id>', methods=['GET'])  # _____GET ID_____
-def get_one_user(id):
-    try:
-        data = Users.query.get(id)
-        if not data:
-            return jsonify({"msg": "User not found"}), 404
-        
-        return jsonify({"msg": "One user with id: " + str(id), "user": data.serialize()}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET User", "error": str(e)}), 500
-    
+
+# The CRUD routes of every model are generated by resources.Resource from these declarations;
+# the endpoint names are those of the former hand-written views, which metrics and url_for use
+
+# _________________________________________USER_________________________________________
+
+USERS = Resource(
+    Users, '/users', 'user', fields=('name',),
+    endpoints=dict(list='get_users', one='get_one_user', create='create_user', bulk='create_users_bulk',
+                   update='update_user', delete='delete_user'),
+    budgets=dict(list=4, one=3, create=4, bulk=4, update=7, delete=7),
+    messages=dict(
+        list="GET User", list_error="Error in GET Users",
+        one="One user with id: {id}", not_found="User not found", one_error="Error in GET User",
+        required="Name is required", exists="This user already exists",
+        created="User created successfully", create_error="Error in POST User",
+        bulk="Bulk Users processed", bulk_error="Error in POST Bulk Users",
+        updated="User updated successfully", update_error="Error in PUT User",
+        deleted="User deleted successfully with id {id}", delete_error="Error in DELETE User"))
 
 @app.route('/users/<int:id>/favourites', methods=['GET'])  # _____GET USER FAVOURITES_____
+@query_budget(4)
+@conditional('users', ('users', 'favourite_persons', 'favourite_planets', 'persons', 'planets'))
 def get_user_favourites(id):
+    limit, persons_after = page_args('persons_after')
+    limit, planets_after = page_args('planets_after')
     try:
-        user = Users.query.get(id)
-        if not user:
+        # Keyed on person_id / planet_id so each page is a range scan of the (user_id, ...) unique index
+        fav_persons = db.session.query(Favourite_persons.id, Favourite_persons.user_id, Favourite_persons.person_id, Persons.name) \
+            .join(Persons, Persons.id == Favourite_persons.person_id) \
+            .filter(Favourite_persons.user_id == id)
+        fav_persons, next_persons_cursor = paginate(fav_persons, Favourite_persons, limit, persons_after, key='person_id')
+
+        fav_planets = db.session.query(Favourite_planets.id, Favourite_planets.user_id, Favourite_planets.planet_id, Planets.name) \
+            .join(Planets, Planets.id == Favourite_planets.planet_id) \
+            .filter(Favourite_planets.user_id == id)
+        fav_planets, next_planets_cursor = paginate(fav_planets, Favourite_planets, limit, planets_after, key='planet_id')
+
+        if not fav_persons and not fav_planets and not db.session.query(Users.id).filter_by(id=id).first():
             return jsonify({"msg": "User not found"}), 404
 
-        fav_persons = Favourite_persons.query.filter_by(id=id).all()
-        fav_planets = Favourite_planets.query.filter_by(id=id).all()
-
-        fav_persons_data = [fav.serialize() for fav in fav_persons] if fav_persons else []
-        fav_planets_data = [fav.serialize() for fav in fav_planets] if fav_planets else []
-
         return jsonify({
             "msg": f"Favourites for user {id}",
-            "favourite_persons": fav_persons_data,
-            "favourite_planets": fav_planets_data
+            "favourite_persons": [dict(fav._mapping) for fav in fav_persons],
+            "favourite_planets": [dict(fav._mapping) for fav in fav_planets],
+            "next_persons_cursor": next_persons_cursor,
+            "next_planets_cursor": next_planets_cursor
         }), 200
     
     except Exception as e:
         return jsonify({"msg": "Error in GET User Favourites", "error": str(e)}), 500
 
-    
-@app.route('/users', methods=['POST'])  # _____POST_____
-def create_user():
-    try:
-        name = request.json.get('name', None)
-        if not name:
-            return jsonify({"msg": "Name is required"}), 400
-        
-        check = Users.query.filter_by(name=name).first()
-        if check:
-            return jsonify({"msg": "This user already exists"}), 400
-
-        new_user = Users(name=name)
-        db.session.add(new_user)
-        db.session.commit()
-
-        return jsonify({"msg": "User created successfully", "data": new_user.serialize()}), 201
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in POST User", "error": str(e)}), 500
-    
-
-@app.route('/users/<int:id>', methods=['PUT'])  # _____PUT_____
-def update_user(id):
-    try:
-        data = Users.query.get(id)
-        if not data:
-            return jsonify({"msg": "User not found"}), 404
-
-        name = request.json.get('name', data.name)
-
-        data.name = name
-
-        db.session.commit()
-
-        return jsonify({"msg": "User updated successfully", "data": data.serialize()}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in PUT User", "error": str(e)}), 500
-    
-
-@app.route('/users/<int:id>', methods=['DELETE'])  # _____DELETE_____
-def delete_user(id):
-    try:
-        data = Users.query.get(id)
-        if not data:
-            return jsonify({"msg": "User not found"}), 404
-
-        db.session.delete(data)
-        db.session.commit()
-
-        return jsonify({"msg": "User deleted successfully with id " + str(id)}), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in DELETE User", "error": str(e)}), 500
-
-
 
 # ________________________________________PERSON________________________________________
 
-@app.route('/persons', methods=['GET'])  # _____GET_____
-def get_persons():
-    try:
-        data = Persons.query.all()
-        data = [person.serialize() for person in data]
-
-        return jsonify({"msg": "GET Persons", "data": data}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET Person", "error": str(e)}), 500
-
-
-@app.route('/persons/<int:id>', methods=['GET'])  # _____GET ID_____
-def one_person(id):
+PERSONS = Resource(
+    Persons, '/persons', 'person', fields=('name', 'planet_id'),
+    endpoints=dict(list='get_persons', one='one_person', create='create_person', bulk='create_persons_bulk',
+                   update='update_person', delete='delete_person'),
+    budgets=dict(list=4, one=3, create=4, bulk=5, update=7, delete=5),
+    messages=dict(
+        list="GET Persons", list_error="Error in GET Person",
+        one="GET One Person with ID: {id}", not_found="Person not found", one_error="Error in GET ID Person",
+        required="All fields are required", exists="This person already exists", missing="Invalid planet_id",
+        created="Person created", create_error="Error in POST Person",
+        bulk="Bulk Persons processed", bulk_error="Error in POST Bulk Persons",
+        updated="Person updated", invalid="Invalid planet_id", update_error="Error in PUT Person",
+        deleted="Person deleted with id {id}", delete_error="Error in DELETE Person"))
+
+@app.route('/persons/search', methods=['GET'])  # _____SEARCH_____
+@query_budget(2)
+@conditional('persons', ('persons',))
+def search_persons():
+    limit, offset = page_args('offset')
+    q = search_args()
     try:
-        data = Persons.query.get(id)
-        if not data:
-            return jsonify({"msg": "Person not found"}), 404
-        
-        return jsonify({"msg": "GET One Person with ID: " + str(id), "person": data.serialize()}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET ID Person", "error": str(e)}), 500
+        data, next_cursor = search_page(Persons, q, limit, offset)
 
+        return jsonify({"msg": "Search Persons", "data": data, "next_cursor": next_cursor}), 200
 
-@app.route('/persons', methods=['POST'])  # _____POST_____
-def create_person():
-    try:
-        name = request.json.get('name', None)
-        planet_id = request.json.get('planet_id', None)
-        
-        if not name or not planet_id:
-            return jsonify({"msg": "All fields are required"}), 400
-        
-        check = Persons.query.filter_by(name=name).first()
-        if check:
-            return jsonify({"msg": "This person already exists"}), 400
-
-        new_person = Persons(name=name, planet_id=planet_id)
-
-        db.session.add(new_person)
-        db.session.commit()
-
-        return jsonify({"msg": "Person created", "data": new_person.serialize()}), 201
-    
     except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in POST Person", "error": str(e)}), 500
+        return jsonify({"msg": "Error in GET Search Persons", "error": str(e)}), 500
 
 
-@app.route('/persons/<int:id>', methods=['PUT'])  # _____PUT_____
-def update_person(id):
+@app.route('/persons/top', methods=['GET'])  # _____GET TOP_____
+@query_budget(2)
+@conditional('persons', ('persons', 'favourite_persons'))
+def top_persons():
+    limit, _ = page_args()
     try:
-        data = Persons.query.get(id)
-        if not data:
-            return jsonify({"msg": "Person not found"}), 404
-
-        name = request.json.get('name', data.name)
-        planet_id = request.json.get('planet_id', data.planet_id)
-        
-        data.name = name
-        data.planet_id = planet_id
+        # A walk down the end of ix_persons_favourite_count, however many favourites there are
+        rows = db.session.query(Persons.id, Persons.name, Persons.favourite_count) \
+            .order_by(Persons.favourite_count.desc(), Persons.id.desc()).limit(limit)
 
-        db.session.commit()
+        return jsonify({"msg": "Most favourited Persons", "data": [dict(row._mapping) for row in rows]}), 200
 
-        return jsonify({"msg": "Person updated", "data": data.serialize()}), 200
-    
     except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in PUT Person", "error": str(e)}), 500
-
-
-@app.route('/persons/<int:id>', methods=['DELETE'])  # _____DELETE_____
-def delete_person(id):
-    try:
-        data = Persons.query.get(id)
-        if not data:
-            return jsonify({"msg": "Person not found"}), 404
-        
-        db.session.delete(data)
-        db.session.commit()
-
-        return jsonify({"msg": "Person deleted with id " + str(id)}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in DELETE Person", "error": str(e)}), 500
-
+        return jsonify({"msg": "Error in GET Top Persons", "error": str(e)}), 500
 
 
 # ________________________________________PLANETS________________________________________
 
-@app.route('/planets', methods=['GET'])  # _____GET_____
-def get_planets():
+PLANETS = Resource(
+    Planets, '/planets', 'planet', fields=('name',), created_status=200,
+    endpoints=dict(list='get_planets', one='one_planet', create='create_planet', bulk='create_planets_bulk',
+                   update='update_planet', delete='delete_planet'),
+    budgets=dict(list=6, one=4, create=4, bulk=4, update=8, delete=7),
+    messages=dict(
+        list="GET Planets", list_error="Error in GET Planets",
+        one="GET One Planet with ID: {id}", not_found="Planet not found", one_error="Error in GET ID Planet",
+        required="Name is required", exists="This planet already exists",
+        created="Planet created", create_error="Error in POST Planet",
+        bulk="Bulk Planets processed", bulk_error="Error in POST Bulk Planets",
+        updated="Planet updated", update_error="Error in PUT Planet",
+        deleted="Planet deleted with id {id}", delete_error="Error in DELETE Planet"))
+
+@app.route('/planets/search', methods=['GET'])  # _____SEARCH_____
+@query_budget(2)
+@conditional('planets', ('planets',))
+def search_planets():
+    limit, offset = page_args('offset')
+    q = search_args()
     try:
-        data = Planets.query.all()
-        data = [planet.serialize() for planet in data]
-
-        return jsonify({"msg": "GET Planets", "data": data}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET Planets", "error": str(e)}), 500
-
-
-@app.route('/planets/<int:id>', methods=['GET'])  # _____GET ID_____
-def one_planet(id):
-    try:
-        data = Planets.query.get(id)
-        if not data:
-            return jsonify({"msg": "Planet not found"}), 404
-        
-        return jsonify({"msg": "GET One Planet with ID: " + str(id), "planet": data.serialize()}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET ID Planet", "error": str(e)}), 500
-
-
-@app.route('/planets', methods=['POST'])  # _____POST_____
-def create_planet():
-    try:
-        name = request.json.get('name', None)
-        if not name:
-            return jsonify({"msg": "Name is required"}), 400
-        
-        check = Planets.query.filter_by(name=name).first()
-        if check:
-            return jsonify({"msg": "This planet already exists"}), 400
-
-        new_planet = Planets(name=name)
+        data, next_cursor = search_page(Planets, q, limit, offset)
 
-        db.session.add(new_planet)
-        db.session.commit()
+        return jsonify({"msg": "Search Planets", "data": data, "next_cursor": next_cursor}), 200
 
-        return jsonify({"msg": "Planet created", "data": new_planet.serialize()}), 200
-    
     except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in POST Planet", "error": str(e)}), 500
+        return jsonify({"msg": "Error in GET Search Planets", "error": str(e)}), 500
 
 
-@app.route('/planets/<int:id>', methods=['PUT'])  # _____PUT_____
-def update_planet(id):
+@app.route('/planets/top', methods=['GET'])  # _____GET TOP_____
+@query_budget(2)
+@conditional('planets', ('planets', 'favourite_planets'))
+def top_planets():
+    limit, _ = page_args()
     try:
-        data = Planets.query.get(id)
-        if not data:
-            return jsonify({"msg": "Planet not found"}), 404
-
-        name = request.json.get('name', data.name)
-        
-        data.name = name
+        # A walk down the end of ix_planets_favourite_count, however many favourites there are
+        rows = db.session.query(Planets.id, Planets.name, Planets.favourite_count) \
+            .order_by(Planets.favourite_count.desc(), Planets.id.desc()).limit(limit)
 
-        db.session.commit()
+        return jsonify({"msg": "Most favourited Planets", "data": [dict(row._mapping) for row in rows]}), 200
 
-        return jsonify({"msg": "Planet updated", "data": data.serialize()}), 200
-    
     except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in PUT Planet", "error": str(e)}), 500
-
-
-@app.route('/planets/<int:id>', methods=['DELETE'])  # _____DELETE_____
-def delete_planet(id):
-    try:
-        data = Planets.query.get(id)
-        if not data:
-            return jsonify({"msg": "Planet not found"}), 404
-        
-        db.session.delete(data)
-        db.session.commit()
-
-        return jsonify({"msg": "Planet deleted with id " + str(id)}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in DELETE Planet", "error": str(e)}), 500
-
+        return jsonify({"msg": "Error in GET Top Planets", "error": str(e)}), 500
 
 
 # ________________________________________FAVOURITE_PERSON________________________________________
 
-@app.route('/favourite/person', methods=['GET'])  # _____GET_____
-def get_fav_persons():
-    try:
-        data = Favourite_persons.query.all()
-        data = [fav_person.serialize() for fav_person in data]
-
-        return jsonify({"msg": "GET Fav Persons", "data": data}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET Fav Person", "error": str(e)}), 500
-
-
-@app.route('/favourite/person/<int:id>', methods=['GET'])  # _____GET ID_____
-def one_fav_person(id):
-    try:
-        data = Favourite_persons.query.get(id)
-        if not data:
-            return jsonify({"msg": "Fav Person not found"}), 404
-        
-        return jsonify({"msg": "GET One Fav Person with ID: " + str(id), "fav_person": data.serialize()}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET ID Fav Person", "error": str(e)}), 500
-
-
-@app.route('/favourite/person', methods=['POST'])  # _____POST_____
-def create_fav_person():
-    try:
-        user_id = request.json.get('user_id', None)
-        person_id = request.json.get('person_id', None)
-
-        exists = Favourite_persons.query.filter_by(user_id= user_id, person_id=person_id).first()
-        
-        if exists: 
-            return jsonify({"msg": "El personaje ya ha sido agregado a fovoritos"}), 400
-        
-        user_exists = Users.query.filter_by(id=user_id).first()
-        if not user_exists: 
-            return jsonify({"msg": "este usuario no existe"}), 400
-
-        person_exists = Persons.query.filter_by(id=person_id).first()
-        if not person_exists: 
-            return jsonify({"msg": "este personaje no existe"}), 400
-
-        new_fav_person = Favourite_persons(user_id= user_id, person_id=person_id)
-
-        db.session.add(new_fav_person)
-        db.session.commit()
-
-        return jsonify({"msg": "Person created", "data": new_fav_person.serialize()}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in POST Person", "error": str(e)}), 500
-
-
-@app.route('/favourite/person/<int:id>', methods=['PUT'])  # _____PUT_____
-def update_fav_person(id):
-    try:
-        data = Favourite_persons.query.get(id)
-
-        if not data:
-            return jsonify({"msg": "Fav Person not found"}), 404
-
-        user_id = request.json.get('user_id', data.user_id)
-        person_id = request.json.get('person_id', data.person_id)
-        if not user_id or not person_id:
-            return jsonify({"msg": "user_id and person_id cannot be empty"}), 400
-        
-        user_exists = Users.query.get(user_id)
-        person_exists = Persons.query.get(person_id)
-        if not user_exists or not person_exists:
-            return jsonify({"msg": "Invalid user_id or person_id"}), 400
-        
-        data.user_id = user_id
-        data.person_id = person_id
-
-        db.session.commit()
-
-        return jsonify({"msg": "Fav Person updated", "data": data.serialize()}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in PUT Fav Person", "error": str(e)}), 500
-
-
-@app.route('/favourite/person/<int:id>', methods=['DELETE'])  # _____DELETE_____
-def delete_fav_person(id):
-    try:
-        data = Favourite_persons.query.get(id)
-
-        if not data:
-            return jsonify({"msg": "Fav Person not found"}), 404
-        
-        db.session.delete(data)
-        db.session.commit()
-
-        return jsonify({"msg": "Fav Person deleted with id " + str(id)}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in DELETE Fav Person", "error": str(e)}), 500
-    
+FAV_PERSONS = Resource(
+    Favourite_persons, '/favourite/person', 'fav_person', fields=('user_id', 'person_id'),
+    counters={'person_id': Persons}, created_status=200,
+    endpoints=dict(list='get_fav_persons', one='one_fav_person', create='create_fav_person',
+                   update='update_fav_person', delete='delete_fav_person'),
+    budgets=dict(list=2, one=2, create=3, update=6, delete=4),
+    messages=dict(
+        list="GET Fav Persons", list_error="Error in GET Fav Person",
+        one="GET One Fav Person with ID: {id}", not_found="Fav Person not found", one_error="Error in GET ID Fav Person",
+        required={'user_id': "este usuario no existe", 'person_id': "este personaje no existe"},
+        missing={'user_id': "este usuario no existe", 'person_id': "este personaje no existe"},
+        exists="El personaje ya ha sido agregado a fovoritos",
+        created="Person created", create_error="Error in POST Person",
+        updated="Fav Person updated", empty="user_id and person_id cannot be empty",
+        invalid="Invalid user_id or person_id", update_error="Error in PUT Fav Person",
+        deleted="Fav Person deleted with id {id}", delete_error="Error in DELETE Fav Person"))
 
 
 # ________________________________________FAVOURITE_PLANET________________________________________
 
-@app.route('/favourite/planet', methods=['GET'])  # _____GET_____
-def get_fav_planets():
-    try:
-        data = Favourite_planets.query.all()
-        data = [fav_planet.serialize() for fav_planet in data]
-
-        return jsonify({"msg": "GET Fav Planets", "data": data}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET Fav Planets", "error": str(e)}), 500
-
-
-@app.route('/favourite/planet/<int:id>', methods=['GET'])  # _____GET ID_____
-def one_fav_planet(id):
-    try:
-        data = Favourite_planets.query.get(id)
-        if not data:
-            return jsonify({"msg": "Fav Planet not found"}), 404
-        
-        return jsonify({"msg": "GET One Fav Planet with ID: " + str(id), "fav_planet": data.serialize()}), 200
-    
-    except Exception as e:
-        return jsonify({"msg": "Error in GET ID Fav Planet", "error": str(e)}), 500
-
-
-@app.route('/favourite/planet', methods=['POST'])  # _____POST_____
-def create_fav_planet():
-    try:
-        user_id = request.json.get('user_id', None)
-        planet_id = request.json.get('planet_id', None)
-
-        exists = Favourite_planets.query.filter_by(user_id=user_id, planet_id=planet_id).first()
-        if exists: 
-            return jsonify({"msg": "El planeta ya ha sido agregado a favoritos"}), 400
-        
-        user_exists = Users.query.get(user_id)
-        if not user_exists: 
-            return jsonify({"msg": "Este usuario no existe"}), 400
+FAV_PLANETS = Resource(
+    Favourite_planets, '/favourite/planet', 'fav_planet', fields=('user_id', 'planet_id'),
+    counters={'planet_id': Planets}, created_status=200,
+    endpoints=dict(list='get_fav_planets', one='one_fav_planet', create='create_fav_planet',
+                   update='update_fav_planet', delete='delete_fav_planet'),
+    budgets=dict(list=2, one=2, create=3, update=6, delete=4),
+    messages=dict(
+        list="GET Fav Planets", list_error="Error in GET Fav Planets",
+        one="GET One Fav Planet with ID: {id}", not_found="Fav Planet not found", one_error="Error in GET ID Fav Planet",
+        required={'user_id': "Este usuario no existe", 'planet_id': "Este planeta no existe"},
+        missing={'user_id': "Este usuario no existe", 'planet_id': "Este planeta no existe"},
+        exists="El planeta ya ha sido agregado a favoritos",
+        created="Fav Planet created", create_error="Error in POST Fav Planet",
+        updated="Fav Planet updated", empty="user_id and planet_id cannot be empty",
+        invalid="Invalid user_id or planet_id", update_error="Error in PUT Fav Planet",
+        deleted="Fav Planet deleted with id {id}", delete_error="Error in DELETE Fav Planet"))
+
+RESOURCES = (USERS, PERSONS, PLANETS, FAV_PERSONS, FAV_PLANETS)
+register_resources(app, RESOURCES)
+setup_admin(app, RESOURCES)
 
-        planet_exists = Planets.query.get(planet_id)
-        if not planet_exists: 
-            return jsonify({"msg": "Este planeta no existe"}), 400
-
-        new_fav_planet = Favourite_planets(user_id=user_id, planet_id=planet_id)
-
-        db.session.add(new_fav_planet)
-        db.session.commit()
-
-        return jsonify({"msg": "Fav Planet created", "data": new_fav_planet.serialize()}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in POST Fav Planet", "error": str(e)}), 500
-
-
-@app.route('/favourite/planet/<int:id>', methods=['PUT'])  # _____PUT_____
-def update_fav_planet(id):
-    try:
-        data = Favourite_planets.query.get(id)
-
-        if not data:
-            return jsonify({"msg": "Fav Planet not found"}), 404
-
-        user_id = request.json.get('user_id', data.user_id)
-        planet_id = request.json.get('planet_id', data.planet_id)
-        if not user_id or not planet_id:
-            return jsonify({"msg": "user_id and planet_id cannot be empty"}), 400
-        
-        user_exists = Users.query.get(user_id)
-        planet_exists = Planets.query.get(planet_id)
-        if not user_exists or not planet_exists:
-            return jsonify({"msg": "Invalid user_id or planet_id"}), 400
-        
-        data.user_id = user_id
-        data.planet_id = planet_id
-
-        db.session.commit()
-
-        return jsonify({"msg": "Fav Planet updated", "data": data.serialize()}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in PUT Fav Planet", "error": str(e)}), 500
-
-
-@app.route('/favourite/planet/<int:id>', methods=['DELETE'])  # _____DELETE_____
-def delete_fav_planet(id):
-    try:
-        data = Favourite_planets.query.get(id)
-
-        if not data:
-            return jsonify({"msg": "Fav Planet not found"}), 404
-        
-        db.session.delete(data)
-        db.session.commit()
-
-        return jsonify({"msg": "Fav Planet deleted with id " + str(id)}), 200
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"msg": "Error in DELETE Fav Planet", "error": str(e)}), 500
 
 
 
@@ -0,0 +1,113 @@
+"""
+ASGI entry point, the alternative to wsgi.py picked at deploy time with SERVER_MODE=asgi
+(see Procfile), or locally:
+
+    $ uvicorn asgi:app --app-dir src --workers 4
+
+Serves every route of the Flask app with the same responses. Each request runs in a greenlet
+on the event loop and the database engines are rebuilt on their asyncio drivers (asyncpg,
+aiosqlite), so a request waiting on the database yields the loop instead of holding a thread.
+Anything else that blocks (a Redis cache, CPU-heavy compression) still holds the loop, and
+concurrent requests are capped by the pool (DB_POOL_SIZE + DB_MAX_OVERFLOW per worker).
+"""
+import io
+import sys
+from sqlalchemy.util import greenlet_spawn, await_only
+from app import app as flask_app
+from models import db
+from replicas import replicas
+from db_config import async_engine
+
+with flask_app.app_context():
+    engines = db.engines
+    async_engines = {key: async_engine(engine) for key, engine in engines.items()}
+    for key, engine in async_engines.items():
+        engines[key].dispose()
+        engines[key] = engine.sync_engine
+    replicas.watch(engines.get('replica'))
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/%s" % scope["http_version"],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin1")
+        environ[key] = environ[key] + "," + value if key in environ else value
+    if "CONTENT_LENGTH" not in environ:
+        # A chunked request: body holds all of it, Werkzeug reads wsgi.input to the end instead
+        # of treating the body as empty
+        environ["wsgi.input_terminated"] = True
+    return environ
+
+
+def run_wsgi(environ, send):
+    # The Flask app, the iteration of its response (NDJSON streams included) and close() all
+    # run in this one greenlet, so every database call inside can await the asyncio driver
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+
+    body = flask_app(environ, start_response)
+    try:
+        await_only(send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]}))
+        for chunk in body:
+            if chunk:
+                await_only(send({"type": "http.response.body", "body": chunk, "more_body": True}))
+        await_only(send({"type": "http.response.body", "body": b""}))
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            for engine in async_engines.values():
+                await engine.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        raise NotImplementedError("Unsupported ASGI scope type: %s" % scope["type"])
+
+    body, more_body = b"", True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    await greenlet_spawn(run_wsgi, build_environ(scope, body), send)
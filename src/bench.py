@@ -0,0 +1,834 @@
+"""
+Benchmarks for the API endpoints. Every run rebuilds the schema on a scratch database,
+so never point BENCH_DATABASE_URL at real data:
+
+    $ pipenv run bench favourites --favourites 10000
+
+`suite` covers every route, and can flag regressions against an earlier run:
+
+    $ pipenv run bench suite --output baseline.json
+    $ pipenv run bench suite --baseline baseline.json
+"""
+import asyncio
+import json
+import os
+import re
+import resource
+import socket
+import subprocess
+import time
+import tracemalloc
+import click
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+os.environ['DATABASE_URL'] = os.getenv('BENCH_DATABASE_URL', 'sqlite:////tmp/bench.db')
+
+from app import app
+from models import db, Users, Planets, Persons, Favourite_persons, Favourite_planets
+from readmodels import read_page
+from json_provider import FastJSONProvider
+from compression import COMPRESSORS, compress
+from utils import QueryBudgetExceeded
+
+
+def reset_schema():
+    db.drop_all()
+    db.create_all()
+
+
+def insert_rows(model, rows, chunk=10000):
+    for start in range(0, len(rows), chunk):
+        db.session.execute(model.__table__.insert(), rows[start:start + chunk])
+    db.session.commit()
+
+
+def seed_catalogue(persons):
+    planets = max(1, persons // 10)
+    insert_rows(Users, [{"id": i, "name": "user %d" % i} for i in range(1, planets + 1)])
+    insert_rows(Planets, [{"id": i, "name": "planet %d" % i} for i in range(1, planets + 1)])
+    insert_rows(Persons, [{"id": i, "name": "person %d" % i, "planet_id": i % planets + 1} for i in range(1, persons + 1)])
+    insert_rows(Favourite_persons, [{"user_id": i % planets + 1, "person_id": i} for i in range(1, persons + 1)])
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def measure(client, url, repeat):
+    # Wall time in ms of `repeat` sequential GETs through the Flask test client
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, (url, response.status_code)
+    return {
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise click.ClickException("server on port %d did not start" % port)
+
+
+async def load_connection(port, path, deadline, samples, errors):
+    # Minimal keep-alive HTTP/1.1 client, cheap enough not to be the bottleneck
+    request = ("GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path).encode()
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        start = time.perf_counter()
+        try:
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            await reader.readexactly(int(re.search(rb"(?i)content-length: *(\d+)", head).group(1)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # Keep-alive connection closed by the server (worker recycled by max_requests),
+            # retry on a new one like any HTTP client would
+            writer.close()
+            writer = None
+            continue
+        samples.append((time.perf_counter() - start) * 1000)
+        errors[0] += head[9:12] != b"200"
+        if re.search(rb"(?i)connection: *close", head):
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load_run(port, path, concurrency, duration):
+    samples, errors = [], [0]
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[load_connection(port, path, deadline, samples, errors) for _ in range(concurrency)])
+    return samples, errors[0]
+
+
+def module_available(name):
+    import importlib.util
+    return importlib.util.find_spec(name) is not None
+
+
+def process_tree_memory(pid):
+    # RSS and PSS in MB of a server and its workers. PSS splits the pages shared copy-on-write
+    # between processes, so unlike RSS its sum is the real footprint
+    pids, parents = [pid], {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open("/proc/%s/stat" % entry) as stat:
+                    parents[int(entry)] = int(stat.read().rsplit(")", 1)[1].split()[1])
+            except OSError:
+                pass
+    for child, parent in parents.items():
+        if parent == pid:
+            pids.append(child)
+    rss = pss = 0
+    for process in pids:
+        try:
+            with open("/proc/%d/smaps_rollup" % process) as smaps:
+                for line in smaps:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            pass
+    return round(rss / 1024, 1), round(pss / 1024, 1)
+
+
+def process_tree_peak_rss(pid):
+    # Sum of the high-water RSS (VmHWM) in MB of a server and its workers
+    total = 0
+    for process in [pid] + [int(child) for child in open("/proc/%d/task/%d/children" % (pid, pid)).read().split()]:
+        try:
+            with open("/proc/%d/status" % process) as status:
+                total += int(next(line for line in status if line.startswith("VmHWM:")).split()[1])
+        except (OSError, StopIteration):
+            pass
+    return round(total / 1024, 1)
+
+
+def load_stats(samples, errors, duration):
+    return {"requests": len(samples), "errors": errors, "rps": int(len(samples) / duration),
+            "p50_ms": round(percentile(samples, 50), 2), "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2)}
+
+
+def serve_and_load(command, port, path, concurrency, duration, env=None):
+    server = subprocess.Popen(command, env=dict(os.environ, **(env or {})))
+    try:
+        wait_for_port(port)
+        asyncio.run(load_run(port, path, min(concurrency, 10), 1))
+        samples, errors = asyncio.run(load_run(port, path, concurrency, duration))
+        rss, pss = process_tree_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    return dict(load_stats(samples, errors, duration), rss_mb=rss, pss_mb=pss)
+
+
+def report(name, stats):
+    click.echo("%-50s %s" % (name, "  ".join("%s=%s" % item for item in stats.items())))
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option('--favourites', default=10000, help='Favourite persons and planets of the benchmarked user.')
+@click.option('--repeat', default=50)
+def favourites(favourites, repeat):
+    """GET /users/<id>/favourites for a user with many favourites."""
+    with app.app_context():
+        reset_schema()
+        insert_rows(Users, [{"id": 1, "name": "bench"}])
+        insert_rows(Planets, [{"id": i, "name": "planet %d" % i} for i in range(1, favourites + 1)])
+        insert_rows(Persons, [{"id": i, "name": "person %d" % i, "planet_id": i} for i in range(1, favourites + 1)])
+        insert_rows(Favourite_persons, [{"user_id": 1, "person_id": i} for i in range(1, favourites + 1)])
+        insert_rows(Favourite_planets, [{"user_id": 1, "planet_id": i} for i in range(1, favourites + 1)])
+
+    client = app.test_client()
+    limit = app.config['DEFAULT_PAGE_SIZE']
+    report("first page", measure(client, "/users/1/favourites", repeat))
+    report("last page", measure(client, "/users/1/favourites?persons_after=%d&planets_after=%d"
+                                % (favourites - limit, favourites - limit), repeat))
+
+    start = time.perf_counter()
+    pages, url = 0, "/users/1/favourites?limit=%d" % app.config['MAX_PAGE_SIZE']
+    while url:
+        body = client.get(url).get_json()
+        pages += 1
+        url = None
+        if body['next_persons_cursor'] or body['next_planets_cursor']:
+            url = "/users/1/favourites?limit=%d&persons_after=%d&planets_after=%d" % (
+                app.config['MAX_PAGE_SIZE'], body['next_persons_cursor'] or favourites, body['next_planets_cursor'] or favourites)
+    report("full walk (%d favourites each)" % favourites, {"pages": pages, "total_ms": round((time.perf_counter() - start) * 1000, 3)})
+
+
+# Statements that build each payload, whatever the number of rows: one per serialize() level
+EAGER_QUERY_COUNTS = {
+    "/users": 2, "/users/1": 2,
+    "/persons": 2, "/persons/1": 2,
+    "/planets": 3, "/planets/1": 3,
+}
+IN_LIST = re.compile(r'IN \([^()]+\)')
+
+
+@cli.command()
+@click.option('--persons', default='100,5000', help='Comma separated volumes to seed.')
+def queries(persons):
+    """Check /users, /persons and /planets run EAGER_QUERY_COUNTS statements at every volume."""
+    from cache import cache, NullCache
+    # Cached payloads and the ETag version lookup are not part of the count
+    cache.backend = NullCache()
+    statements = []
+    event.listen(Engine, "after_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    client = app.test_client()
+    failures = 0
+    for volume in [int(volume) for volume in persons.split(',')]:
+        with app.app_context():
+            reset_schema()
+            seed_catalogue(volume)
+        for url, expected in EAGER_QUERY_COUNTS.items():
+            del statements[:]
+            response = client.get(url)
+            # The IN_CHUNK batches of one relationship level count once; repeated lookups without
+            # an IN list, the lazy loads of an N+1, each count
+            counted = {IN_LIST.sub('IN (?)', statement) if IN_LIST.search(statement) else i
+                       for i, statement in enumerate(statements)
+                       if not statement.startswith('BEGIN') and 'table_versions' not in statement}
+            used = len(counted)
+            ok = response.status_code == 200 and used == expected
+            failures += not ok
+            click.echo("%-4s %6d persons  GET %-12s %d queries (expected %d) -> %d"
+                       % ("ok" if ok else "FAIL", volume, url, used, expected, response.status_code))
+    if failures:
+        raise click.ClickException("%d request(s) off their expected query count" % failures)
+
+
+def orm_page(model, limit, after):
+    rows = model.query.options(*model.eager_options()).filter(model.id > after).order_by(model.id).limit(limit).all()
+    return [row.serialize() for row in rows]
+
+
+@cli.command()
+@click.option('--persons', default=100000)
+@click.option('--page', default=1000, help='Rows per page, as with ?limit=')
+def readpath(persons, page):
+    """Rows/s and memory per row: ORM instances + serialize() against the Core read path."""
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(persons)
+
+    for model in (Persons, Planets):
+        for name, read in (("orm", orm_page), ("core", lambda model, limit, after: read_page(model, None, limit, after)[0])):
+            with app.app_context():
+                total = model.query.count()
+                start, after, rows = time.perf_counter(), 0, 0
+                while after < total:
+                    rows += len(read(model, page, after))
+                    after += page
+                    db.session.remove()
+                elapsed = time.perf_counter() - start
+
+                tracemalloc.start()
+                read(model, page, 0)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            report("%s %s" % (model.__tablename__, name), {
+                "rows": rows, "rows_per_s": int(rows / elapsed), "bytes_per_row": peak // page})
+
+
+@cli.command('json')
+@click.option('--persons', default=10000)
+@click.option('--repeat', default=20)
+def json_encoding(persons, repeat):
+    """Encode the /persons and /planets payloads with each available encoder."""
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(persons)
+        payloads = {
+            "persons": {"msg": "GET Persons", "data": read_page(Persons, None, persons, 0)[0]},
+            "planets": {"msg": "GET Planets", "data": read_page(Planets, None, persons, 0)[0]},
+        }
+
+    encoders = {"flask default (sorted, ascii)": lambda obj: json.dumps(obj, sort_keys=True, separators=(',', ':'))}
+    for setting in ("stdlib", "orjson"):
+        app.config['JSON_ENCODER'] = setting
+        try:
+            encoders["FastJSONProvider " + setting] = FastJSONProvider(app).dumps_bytes
+        except RuntimeError:
+            click.echo("orjson not installed, skipping")
+
+    for name, payload in payloads.items():
+        for encoder_name, encode in encoders.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                size = len(encode(payload))
+            elapsed = (time.perf_counter() - start) / repeat
+            report("%s %s" % (name, encoder_name), {"ms": round(elapsed * 1000, 2), "bytes": size,
+                                                    "mb_per_s": round(size / elapsed / 1e6, 1)})
+
+
+@cli.command()
+@click.option('--persons', default=10000)
+@click.option('--repeat', default=10)
+def compression(persons, repeat):
+    """Bytes saved and CPU time per encoding and level for the /persons and /planets bodies."""
+    levels = {'gzip': (1, 3, 6, 9), 'zstd': (1, 3, 9, 19), 'br': (1, 4, 9, 11)}
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(persons)
+        client = app.test_client()
+        limit = app.config['MAX_PAGE_SIZE']
+        bodies = {url: client.get(url).get_data() for url in ("/persons?limit=%d" % limit, "/planets?limit=%d" % limit)}
+
+    for url, body in bodies.items():
+        for encoding in COMPRESSORS:
+            for level in levels[encoding]:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    size = len(compress(encoding, level, body))
+                elapsed = (time.perf_counter() - start) / repeat
+                report("%s %s-%d" % (url, encoding, level), {
+                    "bytes": len(body), "compressed": size, "saved_pct": round(100 - 100.0 * size / len(body), 1),
+                    "ms": round(elapsed * 1000, 2), "mb_per_s": round(len(body) / elapsed / 1e6, 1)})
+
+
+@cli.command()
+@click.option('--threads', default=8)
+@click.option('--writes', default=100, help='Transactions per thread.')
+def writers(threads, writes):
+    """Parallel read-then-write transactions on SQLite, fails on "database is locked".
+
+    Each transaction reads, then updates a person, inside a write request as the PUT handlers
+    do. Deferred, the read takes a shared lock that SQLite cannot upgrade while another writer
+    holds the database, and fails it at once whatever the busy timeout. The sqlite profile
+    begins write requests with BEGIN IMMEDIATE, so they wait their turn instead; compare with
+    DB_PROFILE=none."""
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import func, select
+    from sqlalchemy.exc import OperationalError
+
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(1000)
+        profile = app.config['DB_PROFILE']['name']
+        if db.engine.dialect.name != 'sqlite':
+            raise click.ClickException("writers checks the SQLite profile, BENCH_DATABASE_URL is %s" % db.engine.url)
+    table = Persons.__table__
+
+    def worker(n):
+        locked, samples = 0, []
+        with app.test_request_context('/persons/%d' % (n + 1), method='PUT'):
+            for i in range(writes):
+                start = time.perf_counter()
+                try:
+                    with db.engine.connect() as connection, connection.begin():
+                        if not app.config['DB_PROFILE']['pragmas']:
+                            # pysqlite alone would run the read outside any transaction
+                            connection.exec_driver_sql("BEGIN")
+                        count = connection.execute(select(func.count()).select_from(table)).scalar()
+                        connection.execute(table.update().where(table.c.id == n + 1).values(name="writer %d-%d of %d" % (n, i, count)))
+                except OperationalError as e:
+                    if "database is locked" not in str(e):
+                        raise
+                    locked += 1
+                samples.append((time.perf_counter() - start) * 1000)
+        return locked, samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+    samples = [sample for _, thread_samples in results for sample in thread_samples]
+    locked = sum(locked for locked, _ in results)
+    report("%d threads x %d transactions (profile %s)" % (threads, writes, profile), {
+        "locked": locked, "writes_per_s": int(len(samples) / elapsed),
+        "p50_ms": round(percentile(samples, 50), 3), "p99_ms": round(percentile(samples, 99), 3)})
+    if locked:
+        raise click.ClickException('%d transaction(s) failed with "database is locked"' % locked)
+
+
+@cli.command()
+@click.option('--replica', 'replica_path', default='/tmp/bench_replica.db', help='SQLite file the replica copy is written to.')
+@click.option('--port', default=8705)
+def replica(replica_path, port):
+    """Read-your-writes with a lagging replica: a server on two SQLite files, the replica a copy
+    of the primary that never receives the writes."""
+    import sqlite3
+    import urllib.request
+    from http.cookiejar import CookieJar
+
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            raise click.ClickException("replica needs a SQLite BENCH_DATABASE_URL, not %s" % db.engine.url)
+        reset_schema()
+        seed_catalogue(100)
+        primary_path = db.engine.url.database
+        db.engine.dispose()
+    with sqlite3.connect(primary_path) as primary, sqlite3.connect(replica_path) as copy:
+        primary.backup(copy)
+
+    def client():
+        return urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def call(opener, method, path, body=None):
+        request = urllib.request.Request("http://127.0.0.1:%d%s" % (port, path), method=method,
+                                         data=json.dumps(body).encode() if body is not None else None,
+                                         headers={"Content-Type": "application/json"})
+        with opener.open(request) as response:
+            return json.loads(response.read())
+
+    # One worker, so every request shares the in-memory entity cache
+    command = ["gunicorn", "app:app", "--chdir", os.path.dirname(os.path.abspath(__file__)),
+               "-b", "127.0.0.1:%d" % port, "-w", "1", "-k", "gthread", "--threads", "4", "--log-level", "warning"]
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + primary_path, DATABASE_REPLICA_URL="sqlite:///" + replica_path,
+               REPLICA_STICKY_SECONDS="30", CACHE_BACKEND="memory")
+    server = subprocess.Popen(command, env=env)
+    writer, reader = client(), client()
+    checks = []
+    try:
+        wait_for_port(port)
+        call(writer, "PUT", "/persons/1", {"name": "renamed"})
+        name = lambda opener, id: call(opener, "GET", "/persons/%d" % id)["person"]["name"]
+        # The reader has no sticky cookie and sees the replica, which must not reach the cache
+        checks.append(("other client reads the replica", name(reader, 1), "person 1"))
+        checks.append(("writer reads its write after it", name(writer, 1), "renamed"))
+        # A payload the writer cached before its write can't be served back to it either
+        name(writer, 2)
+        call(writer, "PUT", "/persons/2", {"name": "renamed again"})
+        name(reader, 2)
+        checks.append(("writer reads its second write", name(writer, 2), "renamed again"))
+    finally:
+        server.terminate()
+        server.wait()
+        os.remove(replica_path)
+
+    failures = 0
+    for label, got, expected in checks:
+        failures += got != expected
+        click.echo("%-4s %-35s %r (expected %r)" % ("ok" if got == expected else "FAIL", label, got, expected))
+    if failures:
+        raise click.ClickException("%d read-your-writes check(s) failed" % failures)
+
+
+def add_latency(engines, wait):
+    # Stands in for the network round trip to a database server, which SQLite doesn't have
+    latency = float(os.getenv('BENCH_DB_LATENCY_MS', 0)) / 1000
+    for engine in engines:
+        if latency:
+            event.listen(engine, "before_cursor_execute", lambda *args: wait(latency))
+
+
+def sync_server():
+    # gunicorn 'bench:sync_server()'
+    with app.app_context():
+        add_latency(db.engines.values(), time.sleep)
+    return app
+
+
+def async_server():
+    # uvicorn --factory bench:async_server
+    import asgi
+    from sqlalchemy.util import await_only
+    add_latency([engine.sync_engine for engine in asgi.async_engines.values()],
+                lambda seconds: await_only(asyncio.sleep(seconds)))
+    return asgi.app
+
+
+@cli.command()
+@click.option('--concurrency', default=200, help='Open keep-alive connections.')
+@click.option('--duration', default=10, help='Seconds per server.')
+@click.option('--workers', default=2)
+@click.option('--threads', default=8, help='Threads per sync (gthread) worker.')
+@click.option('--path', default='/persons?limit=20')
+@click.option('--db-latency-ms', default=0.0, help='Simulated network round trip added to every statement.')
+def load(concurrency, duration, workers, threads, path, db_latency_ms):
+    """Throughput and latency at high concurrency: gunicorn wsgi (sync) against uvicorn asgi."""
+    os.environ['BENCH_DB_LATENCY_MS'] = str(db_latency_ms)
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(10000)
+
+    src = os.path.dirname(os.path.abspath(__file__))
+    servers = {
+        "sync": ["gunicorn", "bench:sync_server()", "--chdir", src, "-b", "127.0.0.1:8701", "-w", str(workers),
+                 "-k", "gthread", "--threads", str(threads)],
+        "async": ["uvicorn", "--factory", "bench:async_server", "--app-dir", src, "--port", "8702", "--workers", str(workers),
+                  "--log-level", "warning"],
+    }
+    for port, (mode, command) in enumerate(servers.items(), 8701):
+        report("%s %s x%d +%gms/query" % (mode, path, concurrency, db_latency_ms),
+               serve_and_load(command, port, path, concurrency, duration))
+
+
+@cli.command()
+@click.option('--concurrency', default=200, help='Open keep-alive connections.')
+@click.option('--duration', default=10, help='Seconds per worker model.')
+@click.option('--workers', default=2)
+@click.option('--path', default='/persons?limit=20')
+@click.option('--db-latency-ms', default=0.0, help='Simulated network round trip added to every statement.')
+def workers(concurrency, duration, workers, path, db_latency_ms):
+    """Requests/s and memory of each gunicorn worker model, run from gunicorn_config.py."""
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(10000)
+
+    src = os.path.dirname(os.path.abspath(__file__))
+    models = [("sync", {}), ("gthread", {}), ("gthread no preload", {"GUNICORN_PRELOAD": "false"}),
+              ("gevent", {}), ("uvicorn", {"SERVER_MODE": "asgi"})]
+    for port, (name, env) in enumerate(models, 8711):
+        if name == "gevent" and not module_available("gevent"):
+            click.echo("gevent not installed, skipping")
+            continue
+        env = dict(env, WEB_CONCURRENCY=str(workers), BENCH_DB_LATENCY_MS=str(db_latency_ms))
+        env.setdefault("GUNICORN_WORKER_CLASS", name.split()[0])
+        target = "bench:async_server()" if env.get("SERVER_MODE") == "asgi" else "bench:sync_server()"
+        command = ["gunicorn", "-c", os.path.join(src, "gunicorn_config.py"), "-b", "127.0.0.1:%d" % port, target]
+        report("%s x%d +%gms/query" % (name, concurrency, db_latency_ms),
+               serve_and_load(command, port, path, concurrency, duration, env))
+
+@cli.command('metrics')
+@click.option('--duration', default=10, help='Seconds per setting.')
+@click.option('--path', default='/persons?limit=20')
+def metrics_overhead(duration, path):
+    """Latency of one client with instrumentation off, on, and on with Server-Timing."""
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(10000)
+
+    src = os.path.dirname(os.path.abspath(__file__))
+    settings = [("metrics off", {"METRICS_ENABLED": "false"}), ("metrics on", {"METRICS_ENABLED": "true"}),
+                ("metrics + Server-Timing", {"METRICS_ENABLED": "true", "SERVER_TIMING": "true"})]
+    for port, (name, env) in enumerate(settings, 8731):
+        env = dict(env, WEB_CONCURRENCY="1")
+        command = ["gunicorn", "-c", os.path.join(src, "gunicorn_config.py"), "-b", "127.0.0.1:%d" % port]
+        report(name, serve_and_load(command, port, path, 1, duration, env))
+
+
+ROUTE_METHOD_ORDER = ('GET', 'PUT', 'POST', 'DELETE')
+PAGED_ROUTES = re.compile(r'^/(users|persons|planets|favourite/\w+)(/<int:id>/favourites)?$')
+
+
+def route_requests():
+    # Every route of the url_map: reads first, deletes last so the sample rows exist throughout
+    requests = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static' or rule.rule.startswith('/admin'):
+            continue
+        for method in rule.methods & set(ROUTE_METHOD_ORDER):
+            url = rule.rule.replace('<int:id>', '1')
+            if rule.rule.endswith('/search'):
+                url += '?q=123'
+            requests.append((method, rule, url))
+            if method == 'GET' and PAGED_ROUTES.match(rule.rule):
+                # Full pages make readmodels load relationships in several IN batches
+                requests.append((method, rule, url + '?limit=%d' % app.config['MAX_PAGE_SIZE']))
+    return sorted(requests, key=lambda request: ROUTE_METHOD_ORDER.index(request[0]))
+
+
+def route_call(method, rule, url, i):
+    # URL and body of the i-th call of a route, valid against seed_catalogue plus one favourite
+    # planet per user while i stays below the number of planets - 2: writes get fresh names,
+    # favourite pairs that are not taken yet, and deletes a different row each time
+    path = rule.rule
+    if method == 'DELETE':
+        return url.replace('/1', '/%d' % (i + 1)), None
+    bodies = {
+        ('POST', '/users'): lambda: {"name": "bench user %d" % i},
+        ('POST', '/users/bulk'): lambda: [{"name": "bench user %d-%d" % (i, j)} for j in range(100)],
+        ('PUT', '/users/<int:id>'): lambda: {"name": "renamed user"},
+        ('POST', '/persons'): lambda: {"name": "bench person %d" % i, "planet_id": 1},
+        ('POST', '/persons/bulk'): lambda: [{"name": "bench person %d-%d" % (i, j), "planet_id": j % 10 + 1} for j in range(100)],
+        ('PUT', '/persons/<int:id>'): lambda: {"name": "renamed person", "planet_id": 2},
+        ('POST', '/planets'): lambda: {"name": "bench planet %d" % i},
+        ('POST', '/planets/bulk'): lambda: [{"name": "bench planet %d-%d" % (i, j)} for j in range(100)],
+        ('PUT', '/planets/<int:id>'): lambda: {"name": "renamed planet"},
+        ('POST', '/favourite/person'): lambda: {"user_id": 2, "person_id": 3 + i},
+        ('PUT', '/favourite/person/<int:id>'): lambda: {"user_id": 3},
+        ('POST', '/favourite/planet'): lambda: {"user_id": 1, "planet_id": 2 + i},
+        ('PUT', '/favourite/planet/<int:id>'): lambda: {"user_id": 2},
+    }
+    body = bodies.get((method, path))
+    return url, body() if body else None
+
+
+def seed_routes(persons):
+    reset_schema()
+    seed_catalogue(persons)
+    insert_rows(Favourite_planets, [{"user_id": i, "planet_id": i} for i in range(1, max(1, persons // 10) + 1)])
+
+
+@cli.command()
+@click.option('--persons', default=2000)
+def budgets(persons):
+    """Call every route on a seeded dataset and check it stays within its query budget."""
+    app.config.update(TESTING=True, QUERY_BUDGET_MODE='raise')
+    with app.app_context():
+        seed_routes(persons)
+
+    client = app.test_client()
+    failures = 0
+    for method, rule, url in route_requests():
+        view = app.view_functions[rule.endpoint]
+        budget = getattr(view, 'query_budget', None)
+        if budget is None:
+            failures += 1
+            click.echo("NO BUDGET  %-6s %s (%s)" % (method, url, rule.endpoint))
+            continue
+        # `with client` keeps the request context so g.query_budget can be read afterwards
+        with client:
+            try:
+                url, body = route_call(method, rule, url, 0)
+                response = client.open(url, method=method, json=body)
+            except QueryBudgetExceeded as e:
+                failures += 1
+                click.echo("OVER       %-6s %s: %s" % (method, url, e))
+                continue
+            used = g.query_budget['used']
+        # Past a commit the route only logs its violation, the write is already in
+        if used > budget:
+            failures += 1
+            click.echo("OVER       %-6s %s: %s ran %d SQL statements, its query budget is %d"
+                       % (method, url, rule.endpoint, used, budget))
+            continue
+        click.echo("ok  %3d/%-3d %-6s %s -> %d" % (used, budget, method, url, response.status_code))
+    if failures:
+        raise click.ClickException("%d route(s) over or without a query budget" % failures)
+
+
+@cli.command()
+@click.option('--persons', default=10000)
+@click.option('--ids', default=100, help='Persons a page of the front end renders.')
+@click.option('--repeat', default=20)
+def batch(persons, ids, repeat):
+    """One GET /persons/<id> per id against one GET /persons?ids= for the same ids."""
+    with app.app_context():
+        reset_schema()
+        seed_catalogue(persons)
+
+    from cache import cache
+    client = app.test_client()
+    wanted = list(range(1, persons, persons // ids))[:ids]
+    for name, urls in (("one request per id", ["/persons/%d" % id for id in wanted]),
+                       ("one ?ids= request", ["/persons?ids=" + ",".join(map(str, wanted))])):
+        samples = []
+        for _ in range(repeat):
+            # Cold entity cache, as for the first render of a page
+            cache.backend.delete(["persons:%d" % id for id in wanted])
+            start = time.perf_counter()
+            for url in urls:
+                assert client.get(url).status_code == 200, url
+            samples.append((time.perf_counter() - start) * 1000)
+        report("%d persons, %s" % (ids, name), {"requests": len(urls), "p50_ms": round(percentile(samples, 50), 3),
+                                                  "p95_ms": round(percentile(samples, 95), 3)})
+
+
+@cli.command()
+@click.option('--persons', default=1000000)
+@click.option('--repeat', default=50)
+def search(persons, repeat):
+    """GET /persons/search for rare, prefix, substring and broad terms."""
+    with app.app_context():
+        reset_schema()
+        start = time.perf_counter()
+        seed_catalogue(persons)
+        report("seeded %d persons" % persons, {"s": round(time.perf_counter() - start, 1)})
+
+    client = app.test_client()
+    terms = [("rare", str(persons - 1)), ("prefix", "person %d" % (persons // 10 - 1)),
+             ("substring", "4242"), ("broad", "person 1")]
+    for name, term in terms:
+        url = "/persons/search?q=%s&limit=20" % term.replace(" ", "+")
+        first = client.get(url).get_json()['data']
+        report("%s q=%r" % (name, term), dict(measure(client, url, repeat), top=first[0]['name'] if first else None))
+
+
+# Worse when higher, except rps
+SUITE_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'queries_per_request')
+
+
+def client_phase(method, rule, url, repeat):
+    # Sequential calls through the Flask test client, with every SQL statement counted
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    client = app.test_client()
+    samples, errors = [], 0
+    event.listen(Engine, "after_cursor_execute", count)
+    try:
+        started = time.perf_counter()
+        for i in range(repeat):
+            call_url, body = route_call(method, rule, url, i)
+            start = time.perf_counter()
+            response = client.open(call_url, method=method, json=body)
+            samples.append((time.perf_counter() - start) * 1000)
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(Engine, "after_cursor_execute", count)
+    return dict(load_stats(samples, errors, elapsed), queries_per_request=round(statements[0] / repeat, 2))
+
+
+def http_phase(paths, port, workers, concurrency, duration):
+    # GET routes through gunicorn and the keep-alive load generator, one server per volume
+    src = os.path.dirname(os.path.abspath(__file__))
+    command = ["gunicorn", "-c", os.path.join(src, "gunicorn_config.py"), "-b", "127.0.0.1:%d" % port]
+    server = subprocess.Popen(command, env=dict(os.environ, WEB_CONCURRENCY=str(workers)))
+    results = {}
+    try:
+        wait_for_port(port)
+        for path in paths:
+            asyncio.run(load_run(port, path, min(concurrency, 10), 0.5))
+            results[path] = load_stats(*asyncio.run(load_run(port, path, concurrency, duration)), duration)
+        peak_rss = process_tree_peak_rss(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    return results, peak_rss
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    # Regressions of results against a saved run: latency or queries up, throughput down
+    regressions = []
+    for volume, routes in results['volumes'].items():
+        for route, phases in routes['routes'].items():
+            for phase, stats in phases.items():
+                before = baseline['volumes'].get(volume, {}).get('routes', {}).get(route, {}).get(phase)
+                if not before:
+                    continue
+                for metric in SUITE_METRICS:
+                    old, new = before.get(metric), stats.get(metric)
+                    if old is None or new is None:
+                        continue
+                    if metric == 'rps':
+                        worse = new < old * (1 - tolerance)
+                    elif metric == 'queries_per_request':
+                        worse = new > old
+                    else:
+                        worse = new > old * (1 + tolerance) and new - old >= min_delta_ms
+                    if worse:
+                        regressions.append("%s persons %s [%s] %s: %s -> %s" % (volume, route, phase, metric, old, new))
+    return regressions
+
+
+@cli.command()
+@click.option('--persons', default='1000,100000', help='Comma separated volumes to seed, e.g. 1000,100000,1000000.')
+@click.option('--repeat', default=50, help='Test client calls per route, capped for writes by the planets available.')
+@click.option('--duration', default=3.0, help='Seconds of HTTP load per GET route, 0 skips the HTTP phase.')
+@click.option('--concurrency', default=50, help='Open keep-alive connections.')
+@click.option('--workers', default=2)
+@click.option('--output', type=click.Path(), help='Write the results as JSON.')
+@click.option('--baseline', type=click.Path(exists=True), help='Saved --output of an earlier run to compare with.')
+@click.option('--tolerance', default=0.2, help='Relative change of latency or throughput that counts as a regression.')
+@click.option('--min-delta-ms', default=1.0, help='Latency changes smaller than this are noise.')
+def suite(persons, repeat, duration, concurrency, workers, output, baseline, tolerance, min_delta_ms):
+    """Every route at each volume: latency, throughput, queries per request and peak RSS."""
+    with app.app_context():
+        database = db.engine.url.render_as_string(hide_password=True)
+    results = {"database": database, "repeat": repeat, "duration": duration, "concurrency": concurrency,
+               "workers": workers, "volumes": {}}
+
+    for volume in [int(value) for value in persons.split(',')]:
+        with app.app_context():
+            seed_routes(volume)
+        requests = route_requests()
+        routes = {}
+        peak_rss = None
+        if duration:
+            paths = [url for method, rule, url in requests if method == 'GET']
+            loaded, peak_rss = http_phase(paths, 8741, workers, concurrency, duration)
+            for path, stats in loaded.items():
+                routes.setdefault('GET ' + path, {})['http'] = stats
+                report("%d persons GET %s [http]" % (volume, path), stats)
+
+        writes = max(1, min(repeat, volume // 10 - 2))
+        for method, rule, url in requests:
+            stats = client_phase(method, rule, url, repeat if method == 'GET' else writes)
+            routes.setdefault('%s %s' % (method, url), {})['client'] = stats
+            report("%d persons %s %s [client]" % (volume, method, url), stats)
+
+        # ru_maxrss only grows, so for a volume it covers the earlier ones too
+        results["volumes"][str(volume)] = {
+            "routes": routes,
+            "client_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "http_peak_rss_mb": peak_rss,
+        }
+        report("%d persons peak RSS" % volume, {key: value for key, value in results["volumes"][str(volume)].items() if key != 'routes'})
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if baseline:
+        with open(baseline) as file:
+            regressions = compare(results, json.load(file), tolerance, min_delta_ms)
+        for regression in regressions:
+            click.echo("REGRESSION " + regression)
+        if regressions:
+            raise click.ClickException("%d regression(s) against %s" % (len(regressions), baseline))
+        click.echo("no regressions against %s" % baseline)
+
+
+if __name__ == '__main__':
+    cli()
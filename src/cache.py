@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, depends_on=()):
+        pass
+
+    def delete(self, keys):
+        pass
+
+
+class LRUCache:
+    """In-process cache, bounded to maxsize entries with a per-entry TTL.
+    Every worker keeps its own copy and only its own writes invalidate it; the
+    table versions stored with each entry (see EntityCache) keep another worker's
+    write from being served stale. RedisCache shares the entries between workers."""
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.dependents = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, depends_on=()):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            for dependency in depends_on:
+                self.dependents.setdefault(dependency, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            if len(self.dependents) > self.maxsize * 4:
+                self.dependents = {dependency: keys for dependency, keys in self.dependents.items()
+                                   if any(key in self.entries for key in keys)}
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+                for dependent in self.dependents.pop(key, ()):
+                    self.entries.pop(dependent, None)
+
+
+class RedisCache:
+    """Cache shared by every worker and instance. Needs the optional redis package.
+    A Redis outage degrades to cache misses instead of failing the request."""
+
+    def __init__(self, url, ttl=60, prefix='api:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except self.errors:
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, depends_on=()):
+        try:
+            pipe = self.client.pipeline()
+            pipe.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+            for dependency in depends_on:
+                pipe.sadd(self.prefix + 'deps:' + dependency, key)
+                pipe.expire(self.prefix + 'deps:' + dependency, self.ttl)
+            pipe.execute()
+        except self.errors:
+            pass
+
+    def delete(self, keys):
+        try:
+            pipe = self.client.pipeline()
+            for key in keys:
+                pipe.smembers(self.prefix + 'deps:' + key)
+            dependents = [member.decode() for members in pipe.execute() for member in members]
+            self.client.delete(*[self.prefix + key for key in list(keys) + dependents],
+                               *[self.prefix + 'deps:' + key for key in keys])
+        except self.errors:
+            pass
+
+
+class EntityCache:
+    """Serialized payloads of single entities, keyed "<table>:<id>".
+
+    A payload that embeds other entities is stored with depends_on, so
+    invalidating one of those (e.g. a person) also drops it (its planet).
+    Each payload is also stored with the versions of the tables it was built
+    from, those the request's ETag is made of, and only served under the same
+    versions: a write invalidation never reached, such as another worker's,
+    still bumped them."""
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        ttl = app.config.get('CACHE_TTL', 60)
+        if backend == 'memory':
+            self.backend = LRUCache(app.config.get('CACHE_MAXSIZE', 10000), ttl)
+        elif backend == 'redis':
+            self.backend = RedisCache(app.config['CACHE_REDIS_URL'], ttl)
+        elif backend in (None, 'none'):
+            self.backend = NullCache()
+        elif isinstance(backend, str):
+            # Fail at startup rather than with a 500 on every GET by id
+            raise ValueError("Unknown CACHE_BACKEND %r, use memory, redis or none" % backend)
+        else:
+            # Any object with get/set/delete, e.g. a fake in tests
+            self.backend = backend
+
+    def get(self, table, id, versions):
+        # None when missing or cached under other table versions
+        entry = self.backend.get("%s:%s" % (table, id))
+        if entry is None or entry[0] != versions:
+            return None
+        return entry[1]
+
+    def set(self, table, id, versions, payload, depends_on=()):
+        # versions: list of the counters, kept as a list so it survives RedisCache's JSON
+        self.backend.set("%s:%s" % (table, id), [versions, payload], ["%s:%s" % dependency for dependency in depends_on])
+
+    def invalidate(self, *entities):
+        # entities are (table, id) pairs; call after the commit
+        keys = ["%s:%s" % (table, id) for table, id in entities if id is not None]
+        if keys:
+            self.backend.delete(keys)
+
+
+cache = EntityCache()
@@ -0,0 +1,234 @@
+import io
+import random
+import re
+import sqlite3
+import time
+from functools import partial
+from itertools import islice
+import click
+from flask import current_app
+from sqlalchemy import event, func, inspect, text
+from search import SEARCH_MIN_LENGTH
+from models import db, bump_versions, recount_favourites, Users, Planets, Persons, Favourite_persons, Favourite_planets
+
+
+def setup_commands(app):
+    app.cli.add_command(check_indexes)
+    app.cli.add_command(seed)
+
+
+def get_routes(app):
+    # Every GET endpoint of the API, with path arguments filled with 1 and a search term where needed
+    for rule in app.url_map.iter_rules():
+        if "GET" not in rule.methods or rule.endpoint == 'static' or rule.rule.startswith('/admin'):
+            continue
+        url = rule.rule.replace('<int:id>', '1')
+        if rule.rule.endswith('/search'):
+            url += '?q=' + 'a' * SEARCH_MIN_LENGTH
+        yield rule.endpoint, url
+
+
+def is_full_scan(dialect, plan, tables):
+    if dialect == 'postgresql':
+        return any("Seq Scan on" in line for line in plan)
+    # SQLite: "SCAN users" is a full table scan, "SEARCH users USING ..." is an index lookup, and so
+    # is "SCAN persons_search VIRTUAL TABLE INDEX 0:M1", a virtual table scan with a MATCH constraint.
+    # "SCAN anon_1" reads a subquery's rows, not a table
+    return any(line.startswith("SCAN ") and line.split()[1] in tables and " USING " not in line
+               and not re.search(r" VIRTUAL TABLE INDEX \d+:\S", line)
+               for line in plan)
+
+
+def sqlite_planner(connection):
+    # An in-memory database with the schema of `connection` and neither rows nor sqlite_stat1. The
+    # planner then takes every table for a large one and, as with enable_seqscan = off on Postgres,
+    # only scans a table when no index can serve the query, whatever the data and ANALYZE say
+    copy = sqlite3.connect(":memory:")
+    schema = connection.exec_driver_sql(
+        "SELECT name, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid")
+    for name, sql in schema:
+        # Creating an FTS5 table creates its shadow tables, listed after it
+        if not copy.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone():
+            copy.execute(sql)
+    return copy
+
+
+def explain_postgres(connection, statement, parameters):
+    # With seqscan disabled the planner only falls back to it when no index can serve the query,
+    # so the check does not depend on how many rows the tables hold
+    transaction = connection.begin()
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    rows = connection.exec_driver_sql("EXPLAIN " + statement, parameters)
+    plan = [row[0] for row in rows]
+    transaction.rollback()
+    return plan
+
+
+def explain_sqlite(planner, statement, parameters):
+    rows = planner.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+    return [row[-1] for row in rows]
+
+
+@click.command('check-indexes')
+@click.pass_context
+def check_indexes(ctx):
+    """EXPLAIN the SELECTs behind every GET endpoint and fail on full table scans."""
+    captured = []
+    current = {}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((current['endpoint'], statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        client = current_app.test_client()
+        for endpoint, url in get_routes(current_app):
+            current['endpoint'] = endpoint
+            client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+
+    failures = 0
+    with db.engine.connect() as connection:
+        dialect = connection.dialect.name
+        tables = set(inspect(connection).get_table_names())
+        if dialect == 'postgresql':
+            explain = partial(explain_postgres, connection)
+        else:
+            explain = partial(explain_sqlite, sqlite_planner(connection))
+        for endpoint, statement, parameters in captured:
+            plan = explain(statement, parameters)
+            if is_full_scan(dialect, plan, tables):
+                failures += 1
+                click.echo("FULL SCAN in %s:\n  %s\n  %s" % (endpoint, " ".join(statement.split()), "\n  ".join(plan)))
+
+    click.echo("%d queries checked, %d full scans" % (len(captured), failures))
+    if failures:
+        ctx.exit(1)
+
+
+def popular(count, skew, rng):
+    # Rank in [0, count) drawn from a power law: skew 1 is uniform, higher piles onto the first ranks
+    return int(count * rng.random() ** skew)
+
+
+def ranked_ids(first, count, rng):
+    # Popularity rank -> id, shuffled so the popular rows are spread over the table
+    ids = list(range(first, first + count))
+    rng.shuffle(ids)
+    return ids
+
+
+def favourite_rows(users, items, total, skew, rng):
+    # (user_id, item_id) pairs, unique per user: a few users favourite a lot and a few items
+    # are favourited by many, like real traffic
+    cap = len(items) // 2
+    if total > len(users) * cap:
+        raise click.ClickException("%d favourites don't fit %d users x %d items" % (total, len(users), len(items)))
+    counts = [0] * len(users)
+    for _ in range(total):
+        counts[popular(len(users), skew, rng)] += 1
+    overflow = sum(count - cap for count in counts if count > cap)
+    for rank, count in enumerate(counts):
+        extra = min(overflow, cap - count) if count < cap else 0
+        counts[rank] = min(count, cap) + extra
+        overflow -= extra
+    for user_id, count in zip(users, counts):
+        if count * 10 > len(items):
+            chosen = rng.sample(items, count)
+        else:
+            chosen = set()
+            while len(chosen) < count:
+                chosen.add(items[popular(len(items), skew, rng)])
+        for item_id in chosen:
+            yield user_id, item_id
+
+
+def load_rows(connection, table, columns, rows, batch):
+    # COPY on Postgres, executemany elsewhere, one transaction per `batch` rows
+    dialect = db.engine.dialect.name
+    cursor = connection.cursor()
+    loaded = 0
+    while True:
+        chunk = list(islice(rows, batch))
+        if not chunk:
+            return loaded
+        if dialect == 'postgresql':
+            buffer = io.StringIO("".join("\t".join(map(str, row)) + "\n" for row in chunk))
+            cursor.copy_expert("COPY %s (%s) FROM STDIN" % (table, ", ".join(columns)), buffer)
+        else:
+            if dialect == 'sqlite':
+                # The engine runs SQLite in autocommit mode (db_config.tune_sqlite)
+                cursor.execute("BEGIN")
+            marker = "?" if db.engine.dialect.paramstyle == 'qmark' else "%s"
+            cursor.executemany("INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns), ", ".join([marker] * len(columns))), chunk)
+        connection.commit()
+        loaded += len(chunk)
+
+
+@click.command('seed')
+@click.option('--users', default=1000)
+@click.option('--planets', default=100)
+@click.option('--persons', default=10000)
+@click.option('--favourites', default=20000, help='Rows for each favourite table.')
+@click.option('--skew', default=2.0, help='Popularity skew of favourites and planet sizes, 1 is uniform.')
+@click.option('--batch', default=100000, help='Rows per transaction.')
+@click.option('--truncate', is_flag=True, help='Empty the five tables first, otherwise rows are appended.')
+@click.option('--random-seed', default=1)
+def seed(users, planets, persons, favourites, skew, batch, truncate, random_seed):
+    """Bulk-load users, planets, persons and favourites for load testing."""
+    rng = random.Random(random_seed)
+    dialect = db.engine.dialect.name
+    order = (Favourite_persons, Favourite_planets, Persons, Planets, Users)
+    if truncate:
+        if dialect == 'postgresql':
+            db.session.execute(text("TRUNCATE %s RESTART IDENTITY" % ", ".join(model.__tablename__ for model in order)))
+        else:
+            for model in order:
+                db.session.query(model).delete()
+        db.session.commit()
+
+    def first_id(model):
+        return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+    user_ids = ranked_ids(first_id(Users), users, rng)
+    planet_ids = ranked_ids(first_id(Planets), planets, rng)
+    person_ids = ranked_ids(first_id(Persons), persons, rng)
+    db.session.commit()
+    tables = [
+        (Users, ("id", "name"), ((id, "seed user %d" % id) for id in sorted(user_ids))),
+        (Planets, ("id", "name"), ((id, "seed planet %d" % id) for id in sorted(planet_ids))),
+        (Persons, ("id", "name", "planet_id"),
+         ((id, "seed person %d" % id, planet_ids[popular(planets, skew, rng)]) for id in sorted(person_ids))),
+        (Favourite_persons, ("user_id", "person_id"), favourite_rows(user_ids, person_ids, favourites, skew, rng)),
+        (Favourite_planets, ("user_id", "planet_id"), favourite_rows(user_ids, planet_ids, favourites, skew, rng)),
+    ]
+
+    connection = db.engine.raw_connection()
+    total, started = 0, time.perf_counter()
+    try:
+        for model, columns, rows in tables:
+            start = time.perf_counter()
+            count = load_rows(connection, model.__tablename__, columns, rows, batch)
+            elapsed = time.perf_counter() - start
+            total += count
+            click.echo("%-18s %10d rows %8.1fs %10d rows/s" % (model.__tablename__, count, elapsed, count / max(elapsed, 1e-9)))
+        cursor = connection.cursor()
+        if dialect == 'postgresql':
+            # Ids were loaded explicitly, move the sequences past them
+            for model in (Users, Planets, Persons):
+                cursor.execute("SELECT setval(pg_get_serial_sequence('%s', 'id'), (SELECT MAX(id) FROM %s))"
+                               % (model.__tablename__, model.__tablename__))
+        cursor.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+
+    # The favourites were loaded past the handlers that keep favourite_count
+    recount_favourites(db.session)
+    # Clients holding ETags of these collections must see the new rows
+    bump_versions(db.session, *sorted(model.__tablename__ for model in order))
+    db.session.commit()
+    elapsed = time.perf_counter() - started
+    click.echo("%d rows in %.1fs, %d rows/s" % (total, elapsed, total / max(elapsed, 1e-9)))
@@ -0,0 +1,108 @@
+"""
+Response compression negotiated from Accept-Encoding. gzip is always available,
+zstd and br are offered when the optional zstandard / brotli packages are installed.
+Streamed responses (NDJSON) are compressed chunk by chunk so they keep streaming.
+"""
+import zlib
+from flask import request
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Input bytes between flushes of a streamed response: big enough to compress well,
+# small enough that clients still see rows arriving
+STREAM_FLUSH_SIZE = 16 * 1024
+
+
+def gzip_compressor(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def zstd_compressor(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+
+
+def brotli_compressor(level):
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.flush, compressor.finish
+
+
+COMPRESSORS = {'gzip': gzip_compressor}
+if zstandard is not None:
+    COMPRESSORS['zstd'] = zstd_compressor
+if brotli is not None:
+    COMPRESSORS['br'] = brotli_compressor
+
+
+def compress(encoding, level, data):
+    compress_chunk, _, finish = COMPRESSORS[encoding](level)
+    return compress_chunk(data) + finish()
+
+
+def compress_stream(encoding, level, chunks):
+    compress_chunk, flush, finish = COMPRESSORS[encoding](level)
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        out = compress_chunk(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            out += flush()
+            pending = 0
+        if out:
+            yield out
+    yield finish()
+
+
+class Compress:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENCODINGS', ['zstd', 'br', 'gzip'])
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVELS', {'gzip': 6, 'zstd': 3, 'br': 4})
+        app.config.setdefault('COMPRESS_MIMETYPES', ['application/json', 'application/x-ndjson', 'text/html'])
+        self.app = app
+        app.after_request(self.after_request)
+
+    def choose_encoding(self):
+        offered = [name for name in self.app.config['COMPRESS_ENCODINGS'] if name in COMPRESSORS]
+        return request.accept_encodings.best_match(offered) if offered else None
+
+    def after_request(self, response):
+        config = self.app.config
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in config['COMPRESS_MIMETYPES']):
+            return response
+        response.vary.add('Accept-Encoding')
+        # Tiny bodies (errors, 404s, single rows) cost more CPU than the bytes they would save
+        if not response.is_streamed and response.content_length is not None \
+                and response.content_length < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+        level = config['COMPRESS_LEVELS'][encoding]
+
+        if response.is_streamed:
+            response.response = compress_stream(encoding, level, response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress(encoding, level, response.get_data()))
+        response.headers['Content-Encoding'] = encoding
+        return response
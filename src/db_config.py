@@ -0,0 +1,174 @@
+"""
+Engine tuning profiles, picked from the database URL and overridable from the environment.
+DB_PROFILE=none keeps SQLAlchemy's defaults (useful to compare against).
+"""
+import os
+from flask import current_app, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# asyncio driver used for each backend when serving through asgi.py
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def postgres_profile():
+    statement_timeout = env_int("DB_STATEMENT_TIMEOUT_MS", 15000)
+    return {
+        "name": "postgresql",
+        "statement_timeout": statement_timeout,
+        "engine_options": {
+            "pool_size": env_int("DB_POOL_SIZE", 5),
+            "max_overflow": env_int("DB_MAX_OVERFLOW", 10),
+            "pool_timeout": env_int("DB_POOL_TIMEOUT", 10),
+            # Below the usual 30-60 min idle cut of proxies and managed Postgres
+            "pool_recycle": env_int("DB_POOL_RECYCLE", 1800),
+            "pool_pre_ping": True,
+        },
+        "pragmas": {},
+    }
+
+
+def sqlite_profile():
+    return {
+        "name": "sqlite",
+        "engine_options": {
+            # SQLAlchemy 1.4 opens a new file connection per checkout (NullPool), re-running every pragma
+            "poolclass": QueuePool,
+            "pool_size": env_int("DB_POOL_SIZE", 5),
+            "max_overflow": env_int("DB_MAX_OVERFLOW", 10),
+            "connect_args": {"check_same_thread": False},
+        },
+        "pragmas": {
+            # Readers no longer block the writer and the writer no longer blocks readers
+            "journal_mode": "WAL",
+            # Durable across application crashes, fsync only at checkpoints
+            "synchronous": "NORMAL",
+            "busy_timeout": env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+            "mmap_size": env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        },
+    }
+
+
+def database_profile(url):
+    profile = os.getenv("DB_PROFILE", "auto")
+    if profile == "none":
+        return {"name": "none", "engine_options": {}, "pragmas": {}}
+    if url.startswith("postgresql"):
+        return postgres_profile()
+    if url.startswith("sqlite") and ":memory:" not in url and url.rstrip("/") != "sqlite:":
+        return sqlite_profile()
+    return {"name": "default", "engine_options": {"pool_pre_ping": True}, "pragmas": {}}
+
+
+def tune_sqlite(engine, pragmas):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see begin below) instead of pysqlite
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s=%s" % (name, value))
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        # A deferred transaction that reads and then writes cannot wait for the lock, SQLite
+        # fails it with "database is locked" right away. Write requests take the lock up front
+        # with BEGIN IMMEDIATE, which does honour busy_timeout; reads stay deferred and in WAL
+        # mode never wait.
+        if has_request_context() and request.method not in READ_METHODS:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            connection.exec_driver_sql("BEGIN")
+
+
+def tune_postgres(engine, statement_timeout):
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        # Caps the statements of web requests only: flask db upgrade, flask seed and other CLI
+        # commands backfill, index and ANALYZE whole tables on purpose. SET LOCAL ends with
+        # the transaction, so a pooled connection never carries it into one of those
+        if has_request_context():
+            connection.exec_driver_sql("SET LOCAL statement_timeout = %d" % statement_timeout,
+                                       execution_options={"query_budget": False})
+
+
+def async_engine(engine):
+    """The database of engine, with the same profile, on its asyncio driver. Its sync_engine
+    can stand in for engine as long as it is only used inside greenlet_spawn (see asgi.py)."""
+    url = engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError("No asyncio driver for %s databases, serve with SERVER_MODE=wsgi" % backend)
+    profile = database_profile(url.render_as_string(hide_password=False))
+    options = dict(profile['engine_options'])
+    if options.get('poolclass') is QueuePool:
+        options['poolclass'] = AsyncAdaptedQueuePool
+    if 'statement_timeout' in profile:
+        # These engines only ever serve requests (asgi.py), so the timeout can be set per
+        # connection, without tune_postgres' SET LOCAL round trip
+        options['connect_args'] = {"server_settings": {"statement_timeout": str(profile['statement_timeout'])}}
+    result = create_async_engine(url.set(drivername=ASYNC_DRIVERS[backend]), **options)
+
+    if backend == 'sqlite':
+        # models.enable_sqlite_foreign_keys only recognises sqlite3 connections
+        @event.listens_for(result.sync_engine, "connect")
+        def enable_foreign_keys(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+        if profile['pragmas']:
+            tune_sqlite(result.sync_engine, profile['pragmas'])
+    return result
+
+
+def setup_database(app, db):
+    profile = database_profile(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['DB_PROFILE'] = profile
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = profile['engine_options']
+    profiles = {None: profile}
+    replica_url = app.config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        # Binds don't inherit SQLALCHEMY_ENGINE_OPTIONS, the replica gets the profile of its own URL
+        profiles['replica'] = database_profile(replica_url)
+        app.config['SQLALCHEMY_BINDS'] = {'replica': {"url": replica_url, **profiles['replica']['engine_options']}}
+    db.init_app(app)
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if profiles[key]['pragmas'] and engine.dialect.name == 'sqlite':
+                tune_sqlite(engine, profiles[key]['pragmas'])
+            if 'statement_timeout' in profiles[key]:
+                tune_postgres(engine, profiles[key]['statement_timeout'])
+
+
+def database_diagnostics(db):
+    # Settings of the active profile and the values the database actually reports
+    profile = current_app.config['DB_PROFILE']
+    engine = db.engine
+    live = {}
+    # In a transaction, so the values are those the request's statements run with
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite':
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'foreign_keys'):
+                live[name] = connection.exec_driver_sql("PRAGMA %s" % name).scalar()
+        elif engine.dialect.name == 'postgresql':
+            for name in ('statement_timeout', 'max_connections'):
+                live[name] = connection.exec_driver_sql("SHOW %s" % name).scalar()
+    options = {key: (value.__name__ if isinstance(value, type) else value)
+               for key, value in profile['engine_options'].items()}
+    return {
+        "profile": profile['name'],
+        "url": engine.url.render_as_string(hide_password=True),
+        "engine_options": options,
+        "pragmas": profile['pragmas'],
+        "pool": engine.pool.status(),
+        "live": live,
+    }
@@ -0,0 +1,79 @@
+"""
+gunicorn settings for Procfile / render.yaml:
+
+    $ gunicorn -c src/gunicorn_config.py
+
+Every value can be overridden from the environment. GUNICORN_WORKER_CLASS picks the worker
+model: gthread (default, a thread per in-flight request), gevent (greenlets, needs
+$ pipenv install gevent psycogreen) or sync. SERVER_MODE=asgi serves src/asgi.py with uvicorn
+workers instead.
+"""
+import os
+import sys
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+server_mode = os.getenv("SERVER_MODE", "wsgi")
+wsgi_app = "asgi:app" if server_mode == "asgi" else "wsgi"
+
+
+def default_workers():
+    # 2 per CPU this process may run on, plus one. sched_getaffinity sees a container's cpuset where
+    # cpu_count() reports every core of the host, but neither sees a CPU quota: set WEB_CONCURRENCY
+    # on platforms that sell fractions of a CPU (render.yaml). The cap keeps the workers' pools,
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW = 15 connections each, under Postgres' default 100 connections
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # macOS and Windows
+        cpus = os.cpu_count() or 1
+    return min(cpus * 2 + 1, int(os.getenv("GUNICORN_MAX_WORKERS", 6)))
+
+
+workers = int(os.getenv("WEB_CONCURRENCY") or default_workers())
+if server_mode == "asgi":
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+# gunicorn quietly turns sync workers into gthread ones when threads > 1
+threads = int(os.getenv("GUNICORN_THREADS", 4)) if worker_class == "gthread" else 1
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Import the app once in the master so workers share its code and model metadata copy-on-write
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Recycle workers now and then so slow leaks can't grow forever, jittered so they don't all
+# restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+# Longer than DB_STATEMENT_TIMEOUT_MS, so a slow query fails with an error response before
+# the worker is killed
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# Above the idle timeout of the platform's router so it never reuses a closed connection
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 75))
+
+if worker_class == "gevent":
+    # Before the app is preloaded, so its sockets, locks and threads are the cooperative ones
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+
+def post_fork(server, worker):
+    # Connections opened in the master (preload_app) must not be shared with the workers:
+    # drop them from each worker's pools without closing the master's sockets
+    if "app" not in sys.modules:
+        return
+    from app import app
+    from models import db
+    with app.app_context():
+        for engine in db.engines.values():
+            # asgi.py engines only connect inside a worker's event loop, and recreating an
+            # asyncio pool swaps its first-connect lock for a threading one that deadlocks
+            if not engine.dialect.is_async:
+                engine.dispose(close=False)
@@ -0,0 +1,42 @@
+"""
+JSON provider used for every response (jsonify, APIException errors, NDJSON streams).
+Encodes with orjson when it is installed ($ pipenv install orjson) and with the
+stdlib json module otherwise. Output is compact and keys keep serialize() order.
+"""
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    compact = True
+    sort_keys = False
+    ensure_ascii = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        # JSON_ENCODER: "auto" (orjson if available), "orjson" or "stdlib"
+        encoder = app.config.get('JSON_ENCODER', 'auto')
+        if encoder == 'orjson' and orjson is None:
+            raise RuntimeError("JSON_ENCODER=orjson but orjson is not installed")
+        self.use_orjson = orjson is not None and encoder != 'stdlib'
+
+    def dumps_bytes(self, obj):
+        if self.use_orjson:
+            # NON_STR_KEYS matches json.dumps for dicts keyed by ints
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=self.default, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def dumps(self, obj, **kwargs):
+        # Callers asking for specific json.dumps options (indent, cls, ...) get the stdlib encoder
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
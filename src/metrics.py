@@ -0,0 +1,151 @@
+"""
+Request latency and SQL instrumentation per endpoint, exposed in Prometheus text format by
+GET /metrics. Statement counts and SQL time come from cursor events on every engine;
+latency runs from before_request to teardown, so NDJSON streams are timed to their last row.
+SERVER_TIMING=true also reports the request's SQL and total time in a Server-Timing header.
+
+Counters live in each worker process: with several gunicorn workers a scrape sees the
+worker that answered it, so scrape workers individually or run one per container.
+"""
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        lines, total = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, total))
+        lines.append('%s_sum{%s} %s' % (name, labels, round(self.sum, 6)))
+        lines.append('%s_count{%s} %d' % (name, labels, total))
+        return lines
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_duration = Histogram(DURATION_BUCKETS)
+
+
+HISTOGRAMS = (
+    ('http_request_duration_seconds', 'duration', 'Time from the start of the request to the end of its response.'),
+    ('http_request_sql_statements', 'statements', 'SQL statements executed per request.'),
+    ('http_request_sql_duration_seconds', 'sql_duration', 'Time per request spent executing SQL.'),
+)
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.endpoints = {}
+        self.counters = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('SERVER_TIMING', False)
+        self.app = app
+        if not app.config['METRICS_ENABLED']:
+            return
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(Engine, "handle_error", self.on_error)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if has_request_context():
+            timing = g.get('request_timing')
+            if timing is not None:
+                timing[1] += 1
+                timing[2] += elapsed
+
+    def on_error(self, context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
+
+    def before_request(self):
+        # [start, statements, seconds in SQL]
+        g.request_timing = [time.perf_counter(), 0, 0.0]
+
+    def after_request(self, response):
+        g.response_status = response.status_code
+        timing = g.get('request_timing')
+        if self.app.config['SERVER_TIMING'] and timing is not None:
+            response.headers['Server-Timing'] = 'db;dur=%.2f;desc="%d queries", app;dur=%.2f' % (
+                timing[2] * 1000, timing[1], (time.perf_counter() - timing[0]) * 1000)
+        return response
+
+    def teardown_request(self, exc):
+        timing = g.pop('request_timing', None)
+        if timing is None:
+            return
+        elapsed = time.perf_counter() - timing[0]
+        # Rule endpoints rather than paths keep the number of series bounded
+        endpoint = request.url_rule.endpoint if request.url_rule is not None else 'unmatched'
+        status = 500 if exc is not None else g.get('response_status', 500)
+        with self.lock:
+            key = (request.method, endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            series = self.endpoints.get(key[:2])
+            if series is None:
+                series = self.endpoints[key[:2]] = EndpointMetrics()
+            series.duration.observe(elapsed)
+            series.statements.observe(timing[1])
+            series.sql_duration.observe(timing[2])
+
+    def inc(self, name, help, **labels):
+        # Counter owned by another module, e.g. query budget violations
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.counters.setdefault((name, help), {})
+            values[key] = values.get(key, 0) + 1
+
+    def render(self):
+        with self.lock:
+            lines = ['# HELP http_requests_total Requests handled, by endpoint and status.',
+                     '# TYPE http_requests_total counter']
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append('http_requests_total{method="%s",endpoint="%s",status="%s"} %d' % (method, endpoint, status, count))
+            for (name, help), values in sorted(self.counters.items()):
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s counter' % name)
+                for labels, count in sorted(values.items()):
+                    lines.append('%s{%s} %d' % (name, ','.join('%s="%s"' % label for label in labels), count))
+            for name, attribute, help in HISTOGRAMS:
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s histogram' % name)
+                for (method, endpoint), series in sorted(self.endpoints.items()):
+                    labels = 'method="%s",endpoint="%s"' % (method, endpoint)
+                    lines.extend(getattr(series, attribute).render(name, labels))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
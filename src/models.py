@@ -1,95 +1,225 @@
+import sqlite3
+from itertools import chain
 from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
-
-class Users(db.Model):
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, load_only, selectinload
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores FOREIGN KEY constraints unless asked, Postgres always enforces them
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+class Fieldset:
+    """Which columns and expanded relationships serialize() emits and the loader fetches.
+    fields=None means every column, relations=None means every relationship, fully expanded."""
+
+    def __init__(self, fields=None, relations=None):
+        self.fields = fields
+        self.relations = relations
+
+    def has(self, name):
+        return self.fields is None or name in self.fields
+
+    def relation(self, name):
+        # Fieldset for an expanded relationship, None when it is left out
+        if self.relations is None:
+            return ALL_FIELDS if self.has(name) else None
+        return self.relations.get(name)
+
+
+ALL_FIELDS = Fieldset()
+
+
+class Serializer:
+    # Columns and relationships serialize() emits by default, in that order
+    serialize_columns = ()
+    serialize_relations = ()
+
+    def serialize(self, fieldset=None):
+        fieldset = fieldset or ALL_FIELDS
+        data = {column: getattr(self, column) for column in self.serialize_columns if fieldset.has(column)}
+        for name in self.serialize_relations:
+            child = fieldset.relation(name)
+            if child is not None:
+                related = getattr(self, name)
+                data[name] = [item.serialize(child) for item in related] if related else None
+        return data
+
+    @classmethod
+    def related_model(cls, name):
+        return getattr(cls, name).property.mapper.class_
+
+    @classmethod
+    def eager_options(cls, fieldset=None):
+        # Load only the requested columns and preload every expanded relationship, one SELECT per level
+        fieldset = fieldset or ALL_FIELDS
+        columns = [getattr(cls, column) for column in cls.serialize_columns if fieldset.has(column)]
+        options = [load_only(*(columns or [cls.id]))]
+        for name in cls.serialize_relations:
+            child = fieldset.relation(name)
+            if child is not None:
+                options.append(selectinload(getattr(cls, name)).options(*cls.related_model(name).eager_options(child)))
+        return options
+
+    @classmethod
+    def fieldset(cls, fields=None, expand=None):
+        # fields / expand: lists of names, dotted for nested ones ("persons.name"), or None when not given
+        known = set(cls.serialize_columns) | set(cls.serialize_relations)
+        for name in (fields or []) + (expand or []):
+            if name.split('.')[0] not in known:
+                raise ValueError("Unknown field for %s: %s" % (cls.__tablename__, name))
+
+        top_fields = None if fields is None else {name.split('.')[0] for name in fields}
+        top_expand = None if expand is None else {name.split('.')[0] for name in expand}
+        relations = {}
+        for name in cls.serialize_relations:
+            if (top_fields is not None and name not in top_fields) or (top_expand is not None and name not in top_expand):
+                continue
+            prefix = name + '.'
+            child_fields = [field[len(prefix):] for field in fields or [] if field.startswith(prefix)] or None
+            child_expand = None if expand is None else [path[len(prefix):] for path in expand if path.startswith(prefix)]
+            relations[name] = cls.related_model(name).fieldset(child_fields, child_expand)
+        return Fieldset(top_fields, relations)
+
+
+class Users(Serializer, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), nullable=False, unique=True)
-    person_favourites = db.relationship('Favourite_persons', back_populates='user_relationship')
+    person_favourites = db.relationship('Favourite_persons', back_populates='user_relationship', order_by='Favourite_persons.id')
     planet_favourites = db.relationship('Favourite_planets', back_populates='user_relationship')
 
+    serialize_columns = ('id', 'name')
+    serialize_relations = ('person_favourites',)
+
     def __repr__(self):
         return '<Users %r>' % self.name
-
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "person_favourites": [user.serialize() for user in self.person_favourites] if self.person_favourites else None
-        }
     
 
-class Persons(db.Model):
+class Persons(Serializer, db.Model):
     __tablename__ = 'persons'
+    __table_args__ = (db.Index('ix_persons_favourite_count', 'favourite_count', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), nullable=False, unique=True)
-    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'))
-    favourite_of = db.relationship('Favourite_persons', back_populates='person_relationship')
+    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'), index=True)
+    # Rows of favourite_persons pointing here, maintained by the favourite handlers (add_favourites)
+    favourite_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    favourite_of = db.relationship('Favourite_persons', back_populates='person_relationship', order_by='Favourite_persons.id')
+
+    serialize_columns = ('id', 'name', 'planet_id')
+    serialize_relations = ('favourite_of',)
 
     def __repr__(self):
         return '<Person %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "planet_id": self.planet_id,
-            "favourite_of": [person.serialize() for person in self.favourite_of] if self.favourite_of else None
-        }
-
 
-class Planets(db.Model):
+class Planets(Serializer, db.Model):
     __tablename__ = 'planets'
+    __table_args__ = (db.Index('ix_planets_favourite_count', 'favourite_count', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), nullable=False, unique=True)
-    persons = db.relationship('Persons', backref=('planet'))
+    # Rows of favourite_planets pointing here, maintained by the favourite handlers (add_favourites)
+    favourite_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    persons = db.relationship('Persons', backref=('planet'), order_by='Persons.id')
     favourite_of = db.relationship('Favourite_planets', back_populates='planet_relationship')
 
+    serialize_columns = ('id', 'name')
+    serialize_relations = ('persons',)
+
     def __repr__(self):
         return '<Planet %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "persons": [person.serialize() for person in self.persons] if self.persons else None
-        }   
 
-
-class Favourite_persons(db.Model):
+class Favourite_persons(Serializer, db.Model):
     __tablename__ = 'favourite_persons'
+    __table_args__ = (db.UniqueConstraint('user_id', 'person_id', name='uq_favourite_persons_user_person'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     user_relationship = db.relationship('Users', back_populates='person_favourites')
-    person_id = db.Column(db.Integer, db.ForeignKey('persons.id'))
+    person_id = db.Column(db.Integer, db.ForeignKey('persons.id'), index=True)
     person_relationship = db.relationship('Persons', back_populates='favourite_of')
 
+    serialize_columns = ('id', 'user_id', 'person_id')
+
     def __repr__(self):
          return '<Favourite_persons %r>' % self.id
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "user_id" : self.user_id,
-            "person_id" : self.person_id
-    }
 
-
-class Favourite_planets(db.Model):
+class Favourite_planets(Serializer, db.Model):
     __tablename__ = 'favourite_planets'
+    __table_args__ = (db.UniqueConstraint('user_id', 'planet_id', name='uq_favourite_planets_user_planet'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     user_relationship = db.relationship('Users', back_populates='planet_favourites')
-    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'))
+    planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'), index=True)
     planet_relationship = db.relationship('Planets', back_populates='favourite_of')
 
+    serialize_columns = ('id', 'user_id', 'planet_id')
+
     def __repr__(self):
         return '<Favourite_planets %r>' % self.id
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "planet_id": self.planet_id
-        }
\ No newline at end of file
+
+class Table_versions(db.Model):
+    # One counter per table, bumped by every write; GET handlers build their ETag from it
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<Table_versions %r>' % self.name
+
+
+def bump_versions(session, *tables):
+    # Core writes (bulk inserts, INSERT ... ON CONFLICT) call this themselves, ORM writes go through before_flush.
+    # One upsert, so a table's first write costs what the others do; sorted to lock the rows in one order
+    table = Table_versions.__table__
+    connection = session.connection()
+    tables = sorted(set(tables))
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = (postgresql if dialect == 'postgresql' else sqlite).insert(table)
+        connection.execute(insert.values([{"name": name, "version": 1} for name in tables])
+                           .on_conflict_do_update(index_elements=[table.c.name], set_={"version": table.c.version + 1}))
+        return
+    result = connection.execute(table.update().where(table.c.name.in_(tables)).values(version=table.c.version + 1))
+    if result.rowcount < len(tables):
+        existing = {name for (name,) in connection.execute(select(table.c.name).where(table.c.name.in_(tables)))}
+        connection.execute(table.insert(), [{"name": name, "version": 1} for name in tables if name not in existing])
+
+
+def add_favourites(session, model, id, delta):
+    # Atomic favourite_count += delta on a person or planet, in the caller's transaction
+    table = model.__table__
+    session.execute(table.update().where(table.c.id == id).values(favourite_count=table.c.favourite_count + delta))
+
+
+def recount_favourites(session):
+    # favourite_count recomputed from the favourite tables, after loads that bypass the handlers
+    for model, favourite in ((Persons, Favourite_persons.person_id), (Planets, Favourite_planets.planet_id)):
+        table = model.__table__
+        count = select(func.count()).where(favourite == table.c.id).scalar_subquery()
+        session.execute(table.update().values(favourite_count=count))
+
+
+def get_versions(*tables):
+    rows = db.session.query(Table_versions.name, Table_versions.version).filter(Table_versions.name.in_(tables))
+    versions = dict(rows.all())
+    return [versions.get(table, 0) for table in tables]
+
+
+@event.listens_for(Session, "before_flush")
+def bump_flushed_tables(session, flush_context, instances):
+    tables = {obj.__tablename__ for obj in chain(session.new, session.dirty, session.deleted)
+              if isinstance(obj, db.Model) and not isinstance(obj, Table_versions)}
+    if tables:
+        bump_versions(session, *sorted(tables))
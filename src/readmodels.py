@@ -0,0 +1,65 @@
+"""
+Read-only query path for the list endpoints. Selects only the serialized columns with
+SQLAlchemy Core and maps rows to namedtuples, skipping ORM instances, the identity map
+and attribute instrumentation. Produces the same payload as Model.serialize().
+"""
+from collections import namedtuple
+from functools import lru_cache
+from sqlalchemy import select
+from models import db, ALL_FIELDS
+
+# Same batch size selectinload uses, keeps IN lists under every backend's parameter limit
+IN_CHUNK = 500
+
+
+@lru_cache(maxsize=None)
+def read_model(table, columns):
+    return namedtuple(table.title().replace('_', '') + 'Row', columns)
+
+
+def fetch(model, fieldset, where, limit=None, link=None):
+    """Rows of model matching where, ordered by id, as (id, link value, payload) triples.
+    link is the foreign key column the parent level groups the rows by."""
+    table = model.__table__
+    columns = tuple(column for column in model.serialize_columns if fieldset.has(column))
+    Row = read_model(model.__tablename__, columns)
+    keys = [table.c.id, link if link is not None else table.c.id]
+    stmt = select(*keys, *[table.c[column] for column in columns]).where(where).order_by(table.c.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    items = [(row[0], row[1], Row._make(row[2:])._asdict()) for row in db.session.execute(stmt)]
+
+    for name in model.serialize_relations:
+        child = fieldset.relation(name)
+        if child is None:
+            continue
+        prop = getattr(model, name).property
+        (local, remote), = prop.local_remote_pairs
+        related = prop.mapper.class_
+        children = {}
+        ids = [id for id, _, _ in items]
+        for start in range(0, len(ids), IN_CHUNK):
+            for _, parent_id, payload in fetch(related, child, remote.in_(ids[start:start + IN_CHUNK]), link=remote):
+                children.setdefault(parent_id, []).append(payload)
+        for id, _, payload in items:
+            payload[name] = children.get(id) or None
+    return items
+
+
+def read_page(model, fieldset, limit, after):
+    # Keyset page of serialized rows, same contract as utils.paginate
+    fieldset = fieldset or ALL_FIELDS
+    items = fetch(model, fieldset, model.__table__.c.id > after, limit=limit + 1)
+    next_cursor = items[limit - 1][0] if len(items) > limit else None
+    return [payload for _, _, payload in items[:limit]], next_cursor
+
+
+def read_ids(model, fieldset, ids):
+    # Serialized rows for a list of ids in the order given, and the ids that don't exist
+    fieldset = fieldset or ALL_FIELDS
+    found = {}
+    for start in range(0, len(ids), IN_CHUNK):
+        for id, _, payload in fetch(model, fieldset, model.__table__.c.id.in_(ids[start:start + IN_CHUNK])):
+            found[id] = payload
+    return [found[id] for id in ids if id in found], [id for id in ids if id not in found]
@@ -0,0 +1,123 @@
+"""
+Read/write splitting. With DATABASE_REPLICA_URL set, the queries of GET/HEAD requests run on
+the "replica" bind and everything else (writes, flushes, CLI commands) on the primary.
+
+- A client that just wrote gets a short-lived cookie and reads from the primary until it
+  expires (REPLICA_STICKY_SECONDS), so it sees its own writes despite replication lag.
+- Reads fall back to the primary while the replica is down: connection errors mark it down
+  and it is probed again every REPLICA_CHECK_SECONDS.
+
+Other clients may read slightly stale rows. The entity cache only keeps rows read from the
+primary, and sticky clients bypass it, so it never serves a writer an older version.
+Locally, point DATABASE_REPLICA_URL at a copy of the SQLite file ($ sqlite3 /tmp/test.db
+".backup /tmp/replica.db") or at a second Postgres instance; `bench.py replica` checks
+read-your-writes on such a two-file setup.
+"""
+import time
+from flask import request, has_request_context, g
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'db_primary'
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # Flushes always go to the primary, even if a read request ends up writing
+        if bind is None and not self._flushing and replicas.use_replica():
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        try:
+            return super().execute(*args, **kwargs)
+        except OperationalError:
+            if not (has_request_context() and g.get('use_replica')):
+                raise
+            # The replica went away mid-request (on_error marked it down), the rest of the
+            # request, starting with this statement, runs on the primary
+            self.rollback()
+            g.use_replica = False
+            return super().execute(*args, **kwargs)
+
+
+class Replicas:
+    def __init__(self):
+        self.engine = None
+        self.down_until = 0
+        self.checked_at = 0
+
+    def init_app(self, app, db):
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('REPLICA_CHECK_SECONDS', 10)
+        self.app = app
+        with app.app_context():
+            self.watch(db.engines.get('replica'))
+        if self.engine is not None:
+            app.after_request(self.after_request)
+
+    def watch(self, engine):
+        # Also called by asgi.py once the replica bind is rebuilt on its asyncio driver
+        self.engine = engine
+        if engine is not None:
+            event.listen(engine, "handle_error", self.on_error)
+
+    @property
+    def enabled(self):
+        return self.engine is not None
+
+    def on_error(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.mark_down()
+
+    def mark_down(self):
+        self.checked_at = time.monotonic()
+        self.down_until = self.checked_at + self.app.config['REPLICA_CHECK_SECONDS']
+
+    def healthy(self):
+        now = time.monotonic()
+        if now < self.down_until:
+            return False
+        if now - self.checked_at >= self.app.config['REPLICA_CHECK_SECONDS']:
+            self.checked_at = now
+            try:
+                with self.engine.connect() as connection:
+                    connection.execution_options(query_budget=False).exec_driver_sql("SELECT 1")
+            except Exception:
+                self.mark_down()
+                return False
+        return True
+
+    def sticky(self):
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def use_replica(self):
+        if not self.enabled or not has_request_context() or request.method not in READ_METHODS:
+            return False
+        # Decided once per request so a response never mixes rows from both databases
+        if 'use_replica' not in g:
+            g.use_replica = not self.sticky() and self.healthy()
+        return g.use_replica
+
+    def after_request(self, response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            window = self.app.config['REPLICA_STICKY_SECONDS']
+            response.set_cookie(STICKY_COOKIE, "%.3f" % (time.time() + window), max_age=window,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def status(self):
+        return {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "pool": self.engine.pool.status(),
+            "healthy": time.monotonic() >= self.down_until,
+            "sticky_seconds": self.app.config['REPLICA_STICKY_SECONDS'],
+        }
+
+
+replicas = Replicas()
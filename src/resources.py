@@ -0,0 +1,245 @@
+"""
+Declarative CRUD routes. A Resource names a model, its URL, endpoint names, query budgets and
+the wording of its responses; register_resources() generates its collection GET (pages, ?ids=,
+NDJSON streams), GET by id, POST, POST /bulk, PUT and DELETE on one query layer:
+
+- reads go through readmodels (serialized columns only, one IN query per relationship level)
+  and, for single entities, the entity cache, which only keeps rows read from the primary;
+- POST is one INSERT ... ON CONFLICT DO NOTHING, so the unique and foreign key constraints
+  validate it in the same statement; only a failure costs a second lookup, to word the error;
+- PUT is one UPDATE ... RETURNING on Postgres, DELETE one DELETE ... RETURNING after nulling
+  the references to the row, whose cached payloads it drops as well (see
+  utils.update_returning and utils.delete_returning).
+
+Everything else comes from the model metadata: the tables behind an ETag follow
+serialize_relations, foreign keys come from the table, and the cached payloads a write drops
+are the row itself plus every parent whose serialize_relations embed it.
+"""
+from flask import request, jsonify, g
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import MANYTOONE
+from cache import cache
+from replicas import replicas
+from models import db, add_favourites
+from readmodels import read_page, read_ids
+from utils import page_args, wants_stream, stream_rows, bulk_args, bulk_create, bulk_summary, insert_or_ignore, \
+    conditional, serialize_args, query_budget, ids_args, missing_references, update_returning, delete_returning, \
+    coerce_values
+
+ACTIONS = ('list', 'one', 'create', 'bulk', 'update', 'delete')
+
+
+def embedded_tables(model):
+    # The model's table and those of everything its default payload embeds
+    tables = [model.__tablename__]
+    for name in model.serialize_relations:
+        for table in embedded_tables(model.related_model(name)):
+            if table not in tables:
+                tables.append(table)
+    return tuple(tables)
+
+
+class Resource:
+    """CRUD routes of one model under path. endpoints maps the ACTIONS the resource has to their
+    endpoint names, budgets the same actions to query budgets; messages holds the response texts,
+    either one string or one per field (required, missing). counters maps a foreign key to the
+    model whose favourite_count follows the rows pointing at it."""
+
+    def __init__(self, model, path, key, fields, endpoints, budgets, messages, counters=None, created_status=201):
+        self.model = model
+        self.table = model.__tablename__
+        self.path = path
+        self.key = key
+        self.fields = fields
+        self.endpoints = endpoints
+        self.budgets = budgets
+        self.messages = messages
+        self.counters = counters or {}
+        self.created_status = created_status
+        self.tables = embedded_tables(model)
+        self.references = tuple(column.name for column in model.__table__.columns if column.foreign_keys)
+        self.foreign_keys = {local.name: relationship.mapper.class_
+                             for relationship in model.__mapper__.relationships if relationship.direction is MANYTOONE
+                             for local, _ in relationship.local_remote_pairs}
+        self.parents = []
+
+    def message(self, name, field=None, **values):
+        message = self.messages[name]
+        if isinstance(message, dict):
+            message = message[field]
+        return message.format(**values)
+
+    def entities(self, row):
+        # Cached payloads that show row: its own and its parents'
+        return [(self.table, row.get('id'))] + [(table, row.get(column)) for table, column in self.parents]
+
+    def register(self, app, resources):
+        self.parents = [(other.table, remote.name)
+                        for other in resources for name in other.model.serialize_relations
+                        if other.model.related_model(name) is self.model
+                        for _, remote in getattr(other.model, name).property.local_remote_pairs]
+        item = self.path + '/<int:id>'
+        routes = {
+            'list': (self.path, 'GET', self.get_list),
+            'one': (item, 'GET', self.get_one),
+            'create': (self.path, 'POST', self.create),
+            'bulk': (self.path + '/bulk', 'POST', self.create_bulk),
+            'update': (item, 'PUT', self.update),
+            'delete': (item, 'DELETE', self.delete),
+        }
+        for action in ACTIONS:
+            if action not in self.endpoints:
+                continue
+            rule, method, view = routes[action]
+            if method == 'GET':
+                view = conditional(self.table, self.tables)(view)
+            app.add_url_rule(rule, self.endpoints[action], query_budget(self.budgets[action])(view), methods=[method])
+
+    def get_list(self):
+        limit, after = page_args()
+        fieldset = serialize_args(self.model)
+        ids = ids_args()
+        if wants_stream() and ids is None:
+            query = self.model.query.options(*self.model.eager_options(fieldset))
+            return stream_rows(query, self.model, after, fieldset)
+        try:
+            if ids is not None:
+                data, missing = read_ids(self.model, fieldset, ids)
+                return jsonify({"msg": self.message('list'), "data": data, "missing": missing}), 200
+
+            data, next_cursor = read_page(self.model, fieldset, limit, after)
+
+            return jsonify({"msg": self.message('list'), "data": data, "next_cursor": next_cursor}), 200
+
+        except Exception as e:
+            return jsonify({"msg": self.message('list_error'), "error": str(e)}), 500
+
+    def get_one(self, id):
+        fieldset = serialize_args(self.model)
+        try:
+            # Only the default payload is cached, sparse ones are cheap to build. A client that
+            # just wrote skips the cache like it skips the replica, to read its own writes.
+            # Entries are tied to the table versions the ETag was built from (see conditional)
+            versions = g.table_versions
+            cached = fieldset is None and not (replicas.enabled and replicas.sticky())
+            payload = cache.get(self.table, id, versions) if cached else None
+            if payload is None:
+                data, missing = read_ids(self.model, fieldset, [id])
+                if missing:
+                    return jsonify({"msg": self.message('not_found')}), 404
+                payload = data[0]
+                # Rows from a lagging replica would outlive the sticky window of whoever wrote them
+                if fieldset is None and not g.get('use_replica'):
+                    # Embedded entities drop this payload when they change
+                    depends_on = [(self.model.related_model(name).__tablename__, child['id'])
+                                  for name in self.model.serialize_relations for child in payload[name] or []]
+                    cache.set(self.table, id, versions, payload, depends_on=depends_on)
+
+            return jsonify({"msg": self.message('one', id=id), self.key: payload}), 200
+
+        except Exception as e:
+            return jsonify({"msg": self.message('one_error'), "error": str(e)}), 500
+
+    def create(self):
+        try:
+            body = request.json
+            values = {field: body.get(field) for field in self.fields}
+            for field in self.fields:
+                if not values[field]:
+                    return jsonify({"msg": self.message('required', field)}), 400
+            values, misfits = coerce_values(self.model, values)
+            if misfits:
+                return jsonify({"msg": self.message('missing', misfits[0])}), 400
+
+            try:
+                row = insert_or_ignore(self.model, values)
+            except IntegrityError:
+                # A foreign key names a missing row, or a concurrent insert won the unique constraint
+                db.session.rollback()
+                missing = missing_references(self.model, values)
+                if missing:
+                    return jsonify({"msg": self.message('missing', missing[0])}), 400
+                row = None
+            if row is None:
+                db.session.rollback()
+                return jsonify({"msg": self.message('exists')}), 400
+
+            for field, model in self.counters.items():
+                add_favourites(db.session, model, values[field], 1)
+            db.session.commit()
+            cache.invalidate(*self.entities(row))
+
+            # The stored row, not the request body: "2" comes back as the integer column it went into
+            return jsonify({"msg": self.message('created'), "data": self.model(**row).serialize()}), self.created_status
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"msg": self.message('create_error'), "error": str(e)}), 500
+
+    def create_bulk(self):
+        items = bulk_args()
+        try:
+            results = bulk_create(self.model, items, list(self.fields), self.foreign_keys)
+            cache.invalidate(*{entity for result in results if result['status'] == 'created'
+                               for entity in self.entities(items[result['index']])})
+            return jsonify({"msg": self.message('bulk'), "summary": bulk_summary(results), "results": results}), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"msg": self.message('bulk_error'), "error": str(e)}), 500
+
+    def update(self, id):
+        try:
+            body = request.json
+            values = {field: body[field] for field in self.fields if field in body}
+            for field, value in values.items():
+                if not value:
+                    return jsonify({"msg": self.message('empty' if 'empty' in self.messages else 'required', field)}), 400
+
+            try:
+                row, previous = update_returning(self.model, id, values, self.references)
+            except IntegrityError:
+                db.session.rollback()
+                if missing_references(self.model, values):
+                    return jsonify({"msg": self.message('invalid')}), 400
+                return jsonify({"msg": self.message('exists')}), 400
+            if row is None:
+                return jsonify({"msg": self.message('not_found')}), 404
+
+            for field, model in self.counters.items():
+                if previous[field] != row[field]:
+                    add_favourites(db.session, model, previous[field], -1)
+                    add_favourites(db.session, model, row[field], 1)
+            db.session.commit()
+            cache.invalidate(*self.entities(row), *self.entities(dict(previous, id=id)))
+
+            data, _ = read_ids(self.model, None, [id])
+            return jsonify({"msg": self.message('updated'), "data": data[0]}), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"msg": self.message('update_error'), "error": str(e)}), 500
+
+    def delete(self, id):
+        try:
+            row, nulled = delete_returning(self.model, id)
+            if row is None:
+                db.session.rollback()
+                return jsonify({"msg": self.message('not_found')}), 404
+
+            for field, model in self.counters.items():
+                add_favourites(db.session, model, row[field], -1)
+            db.session.commit()
+            # The rows that pointed at it changed too, and so did the payloads embedding them
+            cache.invalidate(*self.entities(row), *nulled)
+
+            return jsonify({"msg": self.message('deleted', id=id)}), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"msg": self.message('delete_error'), "error": str(e)}), 500
+
+
+def register_resources(app, resources):
+    for resource in resources:
+        resource.register(app, resources)
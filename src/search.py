@@ -0,0 +1,83 @@
+"""
+Name search behind /persons/search and /planets/search?q=: case-insensitive substring match,
+prefix matches first, then shorter (closer) names, then id.
+
+Both tiers of matches come from an index and are capped at SEARCH_CANDIDATES rows each before
+they are ranked, so a broad term costs what a narrow one does; pages end at the cap.
+- Prefix matches: an index on lower(name), read as a range (SQLite) or with LIKE 'q%' on its
+  text_pattern_ops (Postgres).
+- Substring matches, from a trigram index, so q needs at least SEARCH_MIN_LENGTH characters.
+  Postgres: a pg_trgm GIN index on lower(name) serves the LIKE '%q%' filter. SQLite: an FTS5
+  trigram table, <table>_search, indexes the names. It is an external content table, so it
+  stores only the index, and triggers on the base table keep it in sync.
+
+The migrations create all of them; db.create_all() (bench, tests, local setups) gets the
+SQLite side from the DDL events below. None is in the model metadata, migrations/env.py keeps
+autogenerate from dropping them (is_search_object).
+"""
+from sqlalchemy import DDL, and_, event, func, literal, not_, select, text, union_all
+from models import db, Persons, Planets
+
+SEARCH_MIN_LENGTH = 3
+SEARCH_CANDIDATES = 1000
+SEARCHABLE = (Persons, Planets)
+# Shadow tables FTS5 keeps next to <table>_search
+FTS5_SHADOW_TABLES = ('data', 'idx', 'content', 'docsize', 'config')
+
+SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5"
+    "(name, content='{table}', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {table}_search(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {table}_search({table}_search, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF name ON {table} BEGIN "
+    "INSERT INTO {table}_search({table}_search, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO {table}_search(rowid, name) VALUES (new.id, new.name); END",
+    # Indexes rows that were there before the table existed
+    "INSERT INTO {table}_search({table}_search) VALUES ('rebuild')",
+    "CREATE INDEX IF NOT EXISTS ix_{table}_name_lower ON {table} (lower(name))",
+)
+
+for model in SEARCHABLE:
+    for statement in SQLITE_SEARCH_DDL:
+        event.listen(model.__table__, "after_create",
+                     DDL(statement.format(table=model.__tablename__)).execute_if(dialect='sqlite'))
+    event.listen(model.__table__, "before_drop",
+                 DDL("DROP TABLE IF EXISTS %s_search" % model.__tablename__).execute_if(dialect='sqlite'))
+
+
+def is_search_object(name):
+    # Tables and indexes of the search, created outside the model metadata
+    return any(name in ('%s_search' % table, 'ix_%s_name_trgm' % table, 'ix_%s_name_lower' % table)
+               or name in ['%s_search_%s' % (table, shadow) for shadow in FTS5_SHADOW_TABLES]
+               for table in (model.__tablename__ for model in SEARCHABLE))
+
+
+def search_page(model, q, limit, offset):
+    # Rows of the model's serialize_columns matching q, ranked; limit + 1 rows tell if there is more
+    table = model.__table__
+    needle = q.lower()
+    lowered = func.lower(table.c.name)
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # Every string starting with needle sorts between it and needle with its last character
+        # bumped, a range of ix_<table>_name_lower
+        prefix = and_(lowered >= needle, lowered < needle[:-1] + chr(ord(needle[-1]) + 1))
+        # A quoted FTS5 phrase is a substring match with the trigram tokenizer
+        phrase = '"%s"' % q.replace('"', '""')
+        matches = select(text("rowid")).select_from(text(model.__tablename__ + "_search")) \
+            .where(text("%s_search MATCH :phrase" % model.__tablename__).bindparams(phrase=phrase)) \
+            .limit(SEARCH_CANDIDATES)
+        substring = table.c.id.in_(matches.scalar_subquery())
+    else:
+        prefix = lowered.startswith(needle, autoescape=True)
+        substring = lowered.contains(needle, autoescape=True)
+    columns = [table.c[column] for column in model.serialize_columns]
+    tiers = [select(literal(rank).label('tier'), *columns).where(condition).limit(SEARCH_CANDIDATES).subquery()
+             for rank, condition in ((0, prefix), (1, and_(substring, not_(prefix))))]
+    candidates = union_all(*[select(tier) for tier in tiers]).subquery()
+    query = select(*[candidates.c[column] for column in model.serialize_columns]).order_by(
+        candidates.c.tier, func.length(candidates.c.name), candidates.c.id).limit(limit + 1).offset(offset)
+    rows = [dict(row._mapping) for row in db.session.execute(query)]
+    next_cursor = offset + limit if len(rows) > limit else None
+    return rows[:limit], next_cursor
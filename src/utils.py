@@ -1,4 +1,14 @@
-from flask import jsonify, url_for
+import hashlib
+from functools import wraps
+from flask import jsonify, url_for, request, current_app, Response, stream_with_context, g, has_request_context
+from sqlalchemy import event, exists, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import ONETOMANY, Session
+from models import db, bump_versions, get_versions
+from readmodels import IN_CHUNK
+from metrics import metrics
+from search import SEARCH_MIN_LENGTH
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +25,370 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def page_args(cursor='after'):
+    # Read ?limit= and ?after= for keyset pagination, capped at MAX_PAGE_SIZE
+    try:
+        limit = int(request.args.get('limit', current_app.config['DEFAULT_PAGE_SIZE']))
+        after = int(request.args.get(cursor, 0))
+    except ValueError:
+        raise APIException("limit and %s must be integers" % cursor)
+    if limit < 1:
+        raise APIException("limit must be greater than 0")
+    return min(limit, current_app.config['MAX_PAGE_SIZE']), after
+
+def search_args():
+    # ?q= of the search endpoints, long enough for the trigram indexes to serve it
+    q = request.args.get('q', '').strip()
+    if len(q) < SEARCH_MIN_LENGTH:
+        raise APIException("q must be at least %d characters" % SEARCH_MIN_LENGTH)
+    return q
+
+def paginate(query, model, limit, after, key='id'):
+    # WHERE key > after ORDER BY key stays an index range scan however deep the page is
+    column = getattr(model, key)
+    rows = query.filter(column > after).order_by(column).limit(limit + 1).all()
+    next_cursor = getattr(rows[limit - 1], key) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def split_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+def ids_args():
+    # ?ids=1,2,3 batch fetch, None when absent; repeated ids are dropped, at most BATCH_MAX_IDS
+    ids = split_arg('ids')
+    if ids is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(id) for id in ids))
+    except ValueError:
+        raise APIException("ids must be a comma separated list of integers")
+    if not ids:
+        raise APIException("ids must not be empty")
+    if len(ids) > current_app.config['BATCH_MAX_IDS']:
+        raise APIException("At most %d ids per request" % current_app.config['BATCH_MAX_IDS'])
+    return ids
+
+def serialize_args(model):
+    # ?fields=id,name and ?expand=persons,persons.favourite_of; None keeps the full default payload
+    fields, expand = split_arg('fields'), split_arg('expand')
+    if fields is None and expand is None:
+        return None
+    try:
+        return model.fieldset(fields, expand)
+    except ValueError as e:
+        raise APIException(str(e))
+
+def wants_stream():
+    # Opt-in with ?stream=1 or Accept: application/x-ndjson
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def stream_rows(query, model, after=0, fieldset=None):
+    # One JSON object per line, read from a server-side cursor STREAM_BATCH_SIZE rows at a time,
+    # so worker memory stays flat and the first rows go out before the last are fetched
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+
+    def generate():
+        rows = query.filter(model.id > after).order_by(model.id).yield_per(batch_size)
+        for row in rows:
+            yield current_app.json.dumps_bytes(row.serialize(fieldset)) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def bulk_args():
+    # Body of a bulk POST: a JSON array of objects, at most MAX_BULK_SIZE long
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        raise APIException("Expected a non-empty JSON array")
+    if len(items) > current_app.config['MAX_BULK_SIZE']:
+        raise APIException("At most %d items per request" % current_app.config['MAX_BULK_SIZE'])
+    return items
+
+def bulk_create(model, items, fields, foreign_keys=None):
+    # Validate every item against the foreign keys and the unique name with IN queries of at
+    # most IN_CHUNK values, then insert the survivors, in one statement per IN_CHUNK rows
+    foreign_keys = foreign_keys or {}
+    results = [None] * len(items)
+    valid = {}
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not all(item.get(f) for f in fields):
+            results[i] = {"index": i, "status": "invalid", "msg": "Fields required: " + ", ".join(fields)}
+            continue
+        values, misfits = coerce_values(model, {f: item[f] for f in fields})
+        if misfits:
+            results[i] = {"index": i, "status": "invalid_" + misfits[0]}
+        else:
+            valid[i] = values
+
+    for key, ref in foreign_keys.items():
+        found = existing_values(ref.id, {values[key] for values in valid.values()})
+        for i in [i for i, values in valid.items() if values[key] not in found]:
+            results[i] = {"index": i, "status": "invalid_" + key}
+            del valid[i]
+
+    # Of the items that passed, the first of each name is inserted unless the name is taken
+    pending = {}
+    for i, values in valid.items():
+        if values['name'] in pending:
+            results[i] = {"index": i, "status": "duplicate"}
+        else:
+            pending[values['name']] = i
+    for name in existing_values(model.name, pending):
+        i = pending.pop(name)
+        results[i] = {"index": i, "status": "duplicate"}
+
+    if pending:
+        ids = insert_many_or_ignore(model, [valid[i] for i in pending.values()])
+        for name, i in pending.items():
+            # A name missing from ids was inserted by a concurrent request after the check above
+            results[i] = {"index": i, "status": "created", "id": ids[name]} if name in ids \
+                else {"index": i, "status": "duplicate"}
+        if ids:
+            bump_versions(db.session, model.__tablename__)
+    db.session.commit()
+    return results
+
+def existing_values(column, values):
+    # The values found in column, one IN query per IN_CHUNK of them
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), IN_CHUNK):
+        query = db.session.query(column).filter(column.in_(values[start:start + IN_CHUNK])) \
+            .execution_options(query_batch=str(column))
+        found.update(value for (value,) in query)
+    return found
+
+def insert_many_or_ignore(model, rows):
+    # Rows inserted with ON CONFLICT DO NOTHING; returns {name: id} of the ones actually inserted.
+    # Postgres takes IN_CHUNK rows per INSERT ... RETURNING. SQLite has no RETURNING in
+    # SQLAlchemy 1.4 and reads the ids back by name after one executemany: write requests hold
+    # its lock from BEGIN IMMEDIATE on (db_config.tune_sqlite), so no other request inserted
+    # any of these names since bulk_create looked them up
+    dialect = db.session.get_bind().dialect.name
+    table = model.__table__
+    ids = {}
+    if dialect == 'postgresql':
+        for start in range(0, len(rows), IN_CHUNK):
+            stmt = postgresql.insert(table).values(rows[start:start + IN_CHUNK]).on_conflict_do_nothing() \
+                .returning(table.c.name, table.c.id)
+            ids.update(db.session.execute(stmt).all())
+        return ids
+    insert = sqlite.insert(table).on_conflict_do_nothing() if dialect == 'sqlite' else table.insert()
+    db.session.execute(insert, rows)
+    names = [row['name'] for row in rows]
+    for start in range(0, len(names), IN_CHUNK):
+        ids.update(db.session.query(model.name, model.id).filter(model.name.in_(names[start:start + IN_CHUNK]))
+                   .execution_options(query_batch='%s ids' % table.name))
+    return ids
+
+def coerce_values(model, values):
+    # Strings given for columns of other types, converted the way both POST paths read a body:
+    # "2" for an Integer column is 2. Returns the values and the names of the ones that don't
+    # convert, such as "abc" there
+    coerced, misfits = dict(values), []
+    for name, value in values.items():
+        python_type = model.__table__.c[name].type.python_type
+        if isinstance(value, str) and python_type is not str:
+            try:
+                coerced[name] = python_type(value)
+            except ValueError:
+                misfits.append(name)
+    return coerced, misfits
+
+def insert_or_ignore(model, values):
+    # One INSERT ... ON CONFLICT DO NOTHING round trip. Returns the stored row, or None when
+    # the row hits a unique constraint; foreign key violations still raise IntegrityError.
+    # values come through coerce_values, so on SQLite, which has no RETURNING in SQLAlchemy 1.4,
+    # they are what the columns read back
+    dialect = db.session.get_bind().dialect.name
+    table = model.__table__
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(table).values(**values).on_conflict_do_nothing().returning(*table.c)
+        row = db.session.execute(stmt).first()
+        row = dict(row._mapping) if row is not None else None
+    elif dialect == 'sqlite':
+        result = db.session.execute(sqlite.insert(table).values(**values).on_conflict_do_nothing())
+        row = dict(values, id=result.lastrowid) if result.rowcount else None
+    else:
+        # Other backends report duplicates as IntegrityError too
+        new_id = db.session.execute(table.insert().values(**values)).inserted_primary_key[0]
+        row = dict(values, id=new_id)
+    if row is not None:
+        bump_versions(db.session, model.__tablename__)
+    return row
+
+def missing_references(model, values):
+    # Foreign key fields of values naming rows that don't exist, in column order, one SELECT of EXISTS
+    checks = [(column.name, exists().where(fk.column == values[column.name]))
+              for column in model.__table__.columns for fk in column.foreign_keys
+              if values.get(column.name) is not None]
+    if not checks:
+        return []
+    row = db.session.execute(select(*[check.label(name) for name, check in checks])).one()
+    return [name for name, _ in checks if not row._mapping[name]]
+
+def update_returning(model, id, values, previous=()):
+    # UPDATE one row; returns its new columns and the values its `previous` columns had before,
+    # or (None, None) when it doesn't exist. Constraints raise IntegrityError like insert_or_ignore.
+    # Postgres does it in one UPDATE ... RETURNING, the old values read through a self-join of the
+    # row; SQLAlchemy 1.4 has no RETURNING for SQLite, which reads the row first instead
+    table = model.__table__
+    if values and db.session.get_bind().dialect.full_returning:
+        old = table.alias('previous')
+        stmt = table.update().where(table.c.id == id).values(**values) \
+            .returning(*table.c, *[old.c[column].label('previous_' + column) for column in previous])
+        if previous:
+            stmt = stmt.where(old.c.id == table.c.id)
+        row = db.session.execute(stmt).first()
+        if row is None:
+            return None, None
+        row = row._mapping
+        new = {column.name: row[column] for column in table.c}
+        old_values = {column: row['previous_' + column] for column in previous}
+    else:
+        row = db.session.execute(select(table).where(table.c.id == id)).first()
+        if row is None:
+            return None, None
+        if values:
+            db.session.execute(table.update().where(table.c.id == id).values(**values))
+        old_values = {column: row._mapping[column] for column in previous}
+        new = dict(row._mapping, **values)
+    if values:
+        bump_versions(db.session, model.__tablename__)
+    return new, old_values
+
+def delete_returning(model, id):
+    # DELETE one row; returns its columns, or None when it doesn't exist, and the (table, id) of
+    # the rows of other tables that pointed at it and got NULL first, as the ORM's default cascade
+    # did, so their cached payloads can go too. UPDATE/DELETE ... RETURNING on Postgres, SELECTs
+    # first on SQLite
+    table = model.__table__
+    returning = db.session.get_bind().dialect.full_returning
+    if not returning:
+        row = db.session.execute(select(table).where(table.c.id == id)).first()
+        if row is None:
+            return None, []
+    changed, nulled = [model.__tablename__], []
+    for relationship in model.__mapper__.relationships:
+        if relationship.direction is ONETOMANY:
+            for _, remote in relationship.local_remote_pairs:
+                stmt = remote.table.update().where(remote == id).values({remote.name: None})
+                if returning:
+                    ids = db.session.execute(stmt.returning(remote.table.c.id)).scalars().all()
+                else:
+                    ids = db.session.execute(select(remote.table.c.id).where(remote == id)).scalars().all()
+                    if ids:
+                        db.session.execute(stmt)
+                if ids:
+                    changed.append(remote.table.name)
+                    nulled.extend((remote.table.name, ref_id) for ref_id in ids)
+    if returning:
+        row = db.session.execute(table.delete().where(table.c.id == id).returning(*table.c)).first()
+        if row is None:
+            return None, []
+    else:
+        db.session.execute(table.delete().where(table.c.id == id))
+    bump_versions(db.session, *changed)
+    return dict(row._mapping), nulled
+
+def bulk_summary(results):
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
+
+def conditional(resource, tables):
+    # ETag from the version counters of every table the payload is built from, read before
+    # the handler queries anything, so a matching If-None-Match costs one primary key lookup
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            versions = get_versions(*tables)
+            # The entity cache only serves payloads built under these same versions
+            g.table_versions = versions
+            key = "%s|%s|%s" % (versions, request.full_path, request.headers.get('Accept', ''))
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            cache_control = current_app.config['CACHE_CONTROL'].get(resource, 'no-cache')
+
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = current_app.make_response(handler(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = cache_control
+            response.vary.add('Accept')
+            return response
+        return wrapper
+    return decorator
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+@event.listens_for(Engine, "after_cursor_execute")
+def charge_query_budget(conn, cursor, statement, parameters, context, executemany):
+    budget = g.get('query_budget') if has_request_context() else None
+    # SQLite's explicit BEGIN is transaction control, not part of the route's query pattern,
+    # and statements run with query_budget=False (health checks) aren't the route's either
+    if budget is None or statement.startswith('BEGIN') or not context.execution_options.get('query_budget', True):
+        return
+    # Further IN_CHUNK batches of one load (readmodels, selectinload) are charged once, and so
+    # are all the chunks of a lookup that names its batch (existing_values), the last shorter one too
+    batch = context.execution_options.get('query_batch')
+    if batch is None and not executemany and parameters is not None and len(parameters) >= IN_CHUNK:
+        batch = statement
+    if batch is not None:
+        if batch in budget['batches']:
+            return
+        budget['batches'].add(batch)
+    budget['used'] += 1
+
+def query_budget_mode():
+    return current_app.config.get('QUERY_BUDGET_MODE') or ('raise' if current_app.debug or current_app.testing else 'log')
+
+def query_budget_message(budget):
+    return "%s ran %d SQL statements, its query budget is %d" % (request.endpoint, budget['used'], budget['max'])
+
+@event.listens_for(Session, "before_commit")
+def check_query_budget(session):
+    # Fails a write over budget before it is committed, the handler rolls it back
+    budget = g.get('query_budget') if has_request_context() else None
+    if budget is not None and budget['used'] > budget['max'] and query_budget_mode() == 'raise':
+        raise QueryBudgetExceeded(query_budget_message(budget))
+
+@event.listens_for(Session, "after_commit")
+def mark_query_budget_committed(session):
+    budget = g.get('query_budget') if has_request_context() else None
+    if budget is not None:
+        budget['committed'] = True
+
+def query_budget(max_statements):
+    # Most SQL statements one request of the route may run, catches N+1 regressions.
+    # QUERY_BUDGET_MODE=raise fails the request, log logs it and counts it in /metrics
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            g.query_budget = {'used': 0, 'max': max_statements, 'batches': set(), 'committed': False}
+            response = handler(*args, **kwargs)
+            mode = query_budget_mode()
+            if g.query_budget['used'] > max_statements and mode != 'off':
+                message = query_budget_message(g.query_budget)
+                # Statements run after a commit can't undo the write, a 500 would only hide it
+                if mode == 'raise' and not g.query_budget['committed']:
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+                metrics.inc('query_budget_violations_total', 'Requests that ran more SQL statements than their route\'s budget.',
+                            endpoint=request.endpoint)
+            return response
+        wrapper.query_budget = max_statements
+        return wrapper
+    return decorator
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
@@ -0,0 +1,80 @@
+"""
+Fixtures of the test suite. The app is imported once, against a scratch SQLite file, and
+every test starts from empty tables and an empty entity cache:
+
+    $ pipenv run test
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+DATABASE = os.path.join(tempfile.mkdtemp(prefix='flask-rest-tests-'), 'test.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ.pop('QUERY_BUDGET_MODE', None)
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app as flask_app
+from cache import cache, LRUCache
+from models import db, Users, Planets, Persons, Favourite_persons, Favourite_planets
+
+
+@pytest.fixture
+def app():
+    # TESTING makes query budgets raise (utils.query_budget_mode)
+    flask_app.config.update(TESTING=True, QUERY_BUDGET_MODE=None)
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    cache.backend = LRUCache()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seed(app):
+    """Users, planets, persons and favourites with predictable ids: user, planet and person i
+    are named "user i", "planet i" and "person i", person i lives on planet (i % planets) + 1."""
+    def seed(users=3, planets=3, persons=6, favourites=()):
+        tables = (
+            (Users, [{"id": i, "name": "user %d" % i} for i in range(1, users + 1)]),
+            (Planets, [{"id": i, "name": "planet %d" % i} for i in range(1, planets + 1)]),
+            (Persons, [{"id": i, "name": "person %d" % i, "planet_id": i % planets + 1} for i in range(1, persons + 1)]),
+            (Favourite_persons, [row for row in favourites if 'person_id' in row]),
+            (Favourite_planets, [row for row in favourites if 'planet_id' in row]),
+        )
+        with app.app_context():
+            for model, rows in tables:
+                if rows:
+                    db.session.execute(model.__table__.insert(), rows)
+            db.session.commit()
+    return seed
+
+
+@pytest.fixture
+def statements():
+    """SQL statements run while the test is in the `with statements:` block, BEGIN left out."""
+    class Recorder(list):
+        def record(self, conn, cursor, statement, parameters, context, executemany):
+            if not statement.startswith('BEGIN'):
+                self.append(statement)
+
+        def __enter__(self):
+            self.clear()
+            event.listen(Engine, "after_cursor_execute", self.record)
+            return self
+
+        def __exit__(self, *exc):
+            event.remove(Engine, "after_cursor_execute", self.record)
+
+    return Recorder()
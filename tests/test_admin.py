@@ -0,0 +1,37 @@
+import re
+from cache import cache
+from models import db, Persons
+
+
+def favourite_counts(app):
+    with app.app_context():
+        return dict(db.session.query(Persons.id, Persons.favourite_count).order_by(Persons.id).all())
+
+
+def form_fields(client, url):
+    # The model's fields, without the _add_another and _continue_editing buttons
+    names = re.findall(r'<(?:input|select)[^>]* name="([a-z_]+)"', client.get(url).get_data(as_text=True))
+    return [name for name in names if not name.startswith('_')]
+
+
+def test_counters_are_not_edited_by_hand(client, seed):
+    seed()
+    assert form_fields(client, '/admin/persons/new/') == ['name', 'planet']
+    assert 'favourite_count' not in form_fields(client, '/admin/planets/edit/?id=1')
+
+
+def test_favourite_admin_writes_keep_the_counters_and_the_cache(app, client, seed):
+    seed()
+    client.post('/admin/favourite_persons/new/', data={'user_relationship': '1', 'person_relationship': '2'})
+    assert favourite_counts(app) == {1: 0, 2: 1, 3: 0, 4: 0, 5: 0, 6: 0}
+
+    client.get('/persons/2')
+    client.get('/persons/3')
+    client.post('/admin/favourite_persons/edit/?id=1', data={'user_relationship': '1', 'person_relationship': '3'})
+    assert favourite_counts(app) == {1: 0, 2: 0, 3: 1, 4: 0, 5: 0, 6: 0}
+    assert cache.backend.get('persons:2') is None and cache.backend.get('persons:3') is None
+    assert [fav['user_id'] for fav in client.get('/persons/3').get_json()['person']['favourite_of']] == [1]
+
+    client.post('/admin/favourite_persons/delete/', data={'id': '1'})
+    assert favourite_counts(app) == {1: 0, 2: 0, 3: 0, 4: 0, 5: 0, 6: 0}
+    assert cache.backend.get('persons:3') is None
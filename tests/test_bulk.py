@@ -0,0 +1,68 @@
+from readmodels import IN_CHUNK
+
+
+def test_bulk_reports_every_item(client, seed):
+    seed()
+    response = client.post('/persons/bulk', json=[
+        {'name': 'Luke', 'planet_id': 1},
+        {'name': 'Luke', 'planet_id': 2},
+        {'name': 'person 1', 'planet_id': 1},
+        {'name': 'Leia'},
+        {'name': 'Han', 'planet_id': 99},
+        'Chewie',
+    ])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result['status'] for result in body['results']] == \
+        ['created', 'duplicate', 'duplicate', 'invalid', 'invalid_planet_id', 'invalid']
+    assert body['summary'] == {'created': 1, 'duplicate': 2, 'invalid': 2, 'invalid_planet_id': 1}
+    assert [result['index'] for result in body['results']] == list(range(6))
+
+    created = body['results'][0]
+    person = client.get('/persons/%d' % created['id']).get_json()['person']
+    assert (person['name'], person['planet_id']) == ('Luke', 1)
+
+
+def test_bulk_without_foreign_keys(client, seed):
+    seed()
+    body = client.post('/planets/bulk', json=[{'name': 'Hoth'}, {'name': 'planet 1'}, {'name': 'Naboo'}]).get_json()
+    assert body['summary'] == {'created': 2, 'duplicate': 1}
+    names = [planet['name'] for planet in client.get('/planets').get_json()['data']]
+    assert names[-2:] == ['Hoth', 'Naboo']
+
+
+def test_bulk_body_must_be_a_bounded_array(app, client):
+    assert client.post('/users/bulk', json={'name': 'Luke'}).status_code == 400
+    assert client.post('/users/bulk', json=[]).status_code == 400
+    size = app.config['MAX_BULK_SIZE']
+    response = client.post('/users/bulk', json=[{'name': 'user %d' % i} for i in range(size + 1)])
+    assert response.status_code == 400
+    assert response.get_json()['message'] == "At most %d items per request" % size
+
+
+def test_only_valid_items_claim_a_name(client, seed):
+    seed()
+    body = client.post('/persons/bulk', json=[{'name': 'Luke', 'planet_id': 99}, {'name': 'Luke', 'planet_id': 1},
+                                              {'name': 'Luke', 'planet_id': 2}]).get_json()
+    assert [result['status'] for result in body['results']] == ['invalid_planet_id', 'created', 'duplicate']
+
+
+def test_string_ids_are_read_like_a_single_post(client, seed):
+    seed()
+    body = client.post('/persons/bulk', json=[{'name': 'Luke', 'planet_id': '2'},
+                                              {'name': 'Leia', 'planet_id': 'two'}]).get_json()
+    assert [result['status'] for result in body['results']] == ['created', 'invalid_planet_id']
+    assert client.get('/persons/%d' % body['results'][0]['id']).get_json()['person']['planet_id'] == 2
+
+    assert client.post('/persons', json={'name': 'Han', 'planet_id': '2'}).status_code == 201
+    response = client.post('/persons', json={'name': 'Chewie', 'planet_id': 'two'})
+    assert (response.status_code, response.get_json()) == (400, {'msg': 'Invalid planet_id'})
+
+
+def test_lookups_stay_within_in_chunk(client, seed, statements):
+    seed(planets=0, persons=0)
+    size = 2 * IN_CHUNK + 1
+    with statements:
+        body = client.post('/planets/bulk', json=[{'name': 'planet %d' % i} for i in range(size)]).get_json()
+    assert body['summary'] == {'created': size}
+    assert max(statement.count('?') for statement in statements) <= IN_CHUNK
@@ -0,0 +1,67 @@
+import pytest
+from flask import Flask
+from cache import EntityCache, LRUCache, NullCache
+from models import db, bump_versions, Persons
+
+
+def write_from_another_worker(app, id, name):
+    # What another worker's PUT leaves behind: the row and the version counter change, but
+    # its cache invalidation never reaches this worker's in-process cache
+    with app.app_context():
+        db.session.query(Persons).filter_by(id=id).update({'name': name})
+        bump_versions(db.session, 'persons')
+        db.session.commit()
+
+
+def test_cache_serves_repeated_reads(client, seed, statements):
+    seed()
+    client.get('/persons/1')
+    with statements:
+        response = client.get('/persons/1')
+    assert response.get_json()['person']['name'] == 'person 1'
+    assert len(statements) == 1 and 'table_versions' in statements[0]
+
+
+def test_payload_cached_before_another_workers_write_is_not_served(app, client, seed):
+    seed()
+    first = client.get('/persons/1')
+    assert first.status_code == 200
+    write_from_another_worker(app, 1, 'Luke')
+
+    response = client.get('/persons/1', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert response.get_json()['person']['name'] == 'Luke'
+    # And the client holding the new ETag gets 304s for the new body, not the old one
+    assert client.get('/persons/1', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_write_to_an_embedded_table_misses_the_parent_payload(app, client, seed):
+    seed()
+    assert client.get('/planets/2').get_json()['planet']['persons'][0]['name'] == 'person 1'
+    write_from_another_worker(app, 1, 'Luke')
+    assert client.get('/planets/2').get_json()['planet']['persons'][0]['name'] == 'Luke'
+
+
+@pytest.mark.parametrize('backend', ['Memory', 'redis ', 'memcached'])
+def test_unknown_backend_name_fails_at_startup(backend):
+    app = Flask(__name__)
+    app.config['CACHE_BACKEND'] = backend
+    with pytest.raises(ValueError, match='Unknown CACHE_BACKEND'):
+        EntityCache().init_app(app)
+
+
+@pytest.mark.parametrize('backend, expected', [('memory', LRUCache), ('none', NullCache), (None, NullCache)])
+def test_backend_names(backend, expected):
+    app = Flask(__name__)
+    app.config['CACHE_BACKEND'] = backend
+    entity_cache = EntityCache()
+    entity_cache.init_app(app)
+    assert type(entity_cache.backend) is expected
+
+
+def test_backend_object_is_used_as_is():
+    app = Flask(__name__)
+    app.config['CACHE_BACKEND'] = fake = LRUCache()
+    entity_cache = EntityCache()
+    entity_cache.init_app(app)
+    assert entity_cache.backend is fake
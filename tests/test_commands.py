@@ -0,0 +1,30 @@
+from sqlalchemy import text
+from models import db
+
+
+def check_indexes(app):
+    with app.app_context():
+        return app.test_cli_runner().invoke(args=['check-indexes'])
+
+
+def test_check_indexes_passes_on_seeded_and_analyzed_tables(app, seed):
+    # sqlite_stat1 of small tables makes the planner pick scans over the foreign key indexes,
+    # the check must not depend on it
+    seed(users=200, planets=50, persons=2000, favourites=[{'user_id': i // 15 % 200 + 1, 'person_id': i % 2000 + 1}
+                                                          for i in range(3000)])
+    with app.app_context():
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+    result = check_indexes(app)
+    assert result.exit_code == 0, result.output
+    assert result.output.endswith(" 0 full scans\n")
+
+
+def test_check_indexes_fails_on_a_missing_index(app, seed):
+    seed()
+    with app.app_context():
+        db.session.execute(text("DROP INDEX ix_favourite_persons_person_id"))
+        db.session.commit()
+    result = check_indexes(app)
+    assert result.exit_code == 1
+    assert "SCAN favourite_persons" in result.output
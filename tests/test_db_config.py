@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import create_engine, event
+from db_config import postgres_profile, tune_postgres
+
+
+@pytest.fixture
+def engine():
+    # tune_postgres' SET LOCAL recorded and swapped for a no-op SQLite can run
+    engine = create_engine('sqlite://')
+    engine.sent = []
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def record(conn, cursor, statement, parameters, context, executemany):
+        engine.sent.append(statement)
+        if statement.startswith('SET LOCAL'):
+            return 'SELECT 1', ()
+        return statement, parameters
+
+    tune_postgres(engine, 1500)
+    yield engine
+    engine.dispose()
+
+
+def test_timeout_is_not_a_connection_setting():
+    # It would reach flask db upgrade and flask seed too
+    assert 'connect_args' not in postgres_profile()['engine_options']
+
+
+def test_request_transactions_get_the_timeout(app, engine):
+    with app.test_request_context('/persons'):
+        with engine.begin() as connection:
+            connection.exec_driver_sql('SELECT 2')
+    assert engine.sent == ['SET LOCAL statement_timeout = 1500', 'SELECT 2']
+
+
+def test_cli_and_migration_transactions_run_without_it(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql('SELECT 2')
+    assert engine.sent == ['SELECT 2']
@@ -0,0 +1,51 @@
+def test_matching_etag_is_answered_from_the_version_counters(client, seed, statements):
+    seed()
+    first = client.get('/persons')
+    assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+
+    with statements:
+        response = client.get('/persons', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == first.headers['ETag']
+    assert len(statements) == 1 and 'table_versions' in statements[0]
+
+
+def test_write_changes_the_etag(client, seed):
+    seed()
+    etag = client.get('/persons/1').headers['ETag']
+    assert client.put('/persons/1', json={'name': 'Luke'}).status_code == 200
+
+    response = client.get('/persons/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['person']['name'] == 'Luke'
+
+
+def test_write_to_an_embedded_table_changes_the_etag(client, seed):
+    # /planets embeds persons, a new person is a new /planets payload
+    seed()
+    etag = client.get('/planets').headers['ETag']
+    assert client.post('/persons', json={'name': 'Leia', 'planet_id': 1}).status_code == 201
+    response = client.get('/planets', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Leia' in [person['name'] for person in response.get_json()['data'][0]['persons']]
+
+
+def test_etag_depends_on_the_url(client, seed):
+    seed()
+    etag = client.get('/persons?limit=1').headers['ETag']
+    assert client.get('/persons?limit=2', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_errors_carry_no_etag(client, seed):
+    seed()
+    response = client.get('/persons/99')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_write_drops_the_cached_payload_of_the_parent(client, seed):
+    seed()
+    assert client.get('/planets/2').get_json()['planet']['persons'][0]['name'] == 'person 1'
+    client.put('/persons/1', json={'name': 'Luke'})
+    assert client.get('/planets/2').get_json()['planet']['persons'][0]['name'] == 'Luke'
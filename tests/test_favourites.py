@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+from models import db, recount_favourites, Persons, Planets, Favourite_persons
+
+
+def favourite_counts(app, model):
+    with app.app_context():
+        return dict(db.session.query(model.id, model.favourite_count).order_by(model.id).all())
+
+
+def test_favourite_is_unique_per_user(app, client, seed):
+    seed()
+    assert client.post('/favourite/person', json={'user_id': 1, 'person_id': 2}).status_code == 200
+    response = client.post('/favourite/person', json={'user_id': 1, 'person_id': 2})
+    assert response.status_code == 400
+    assert response.get_json()['msg'] == "El personaje ya ha sido agregado a fovoritos"
+    assert client.post('/favourite/person', json={'user_id': 2, 'person_id': 2}).status_code == 200
+
+
+def test_uniqueness_is_enforced_by_the_database(app, seed):
+    seed(favourites=[{"user_id": 1, "person_id": 1}])
+    with app.app_context():
+        db.session.add(Favourite_persons(user_id=1, person_id=1))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+@pytest.mark.parametrize('body, field', [({'user_id': 99, 'person_id': 1}, 'user_id'),
+                                         ({'user_id': 1, 'person_id': 99}, 'person_id')])
+def test_favourite_of_missing_row(app, client, seed, body, field):
+    seed()
+    response = client.post('/favourite/person', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['msg'] == ("este usuario no existe" if field == 'user_id' else "este personaje no existe")
+    assert favourite_counts(app, Persons)[1] == 0
+
+
+def test_counters_follow_create_update_and_delete(app, client, seed):
+    seed()
+    created = client.post('/favourite/planet', json={'user_id': 1, 'planet_id': 1}).get_json()['data']
+    client.post('/favourite/planet', json={'user_id': 2, 'planet_id': 1})
+    client.post('/favourite/planet', json={'user_id': 1, 'planet_id': 2})
+    # A duplicate doesn't count twice
+    client.post('/favourite/planet', json={'user_id': 1, 'planet_id': 2})
+    assert favourite_counts(app, Planets) == {1: 2, 2: 1, 3: 0}
+
+    assert client.put('/favourite/planet/%d' % created['id'], json={'planet_id': 3}).status_code == 200
+    assert favourite_counts(app, Planets) == {1: 1, 2: 1, 3: 1}
+
+    # Same planet, only the user changes: nothing moves
+    client.put('/favourite/planet/%d' % created['id'], json={'user_id': 3})
+    assert favourite_counts(app, Planets) == {1: 1, 2: 1, 3: 1}
+
+    assert client.delete('/favourite/planet/%d' % created['id']).status_code == 200
+    assert favourite_counts(app, Planets) == {1: 1, 2: 1, 3: 0}
+
+
+def test_top_orders_by_counter(app, client, seed):
+    seed(favourites=[{"user_id": user, "person_id": 4} for user in (1, 2, 3)] +
+                    [{"user_id": user, "person_id": 2} for user in (1, 2)])
+    with app.app_context():
+        # seed() loads favourites past the handlers, as flask seed does
+        recount_favourites(db.session)
+        db.session.commit()
+    client.post('/favourite/person', json={'user_id': 3, 'person_id': 2})
+    client.post('/favourite/person', json={'user_id': 1, 'person_id': 6})
+
+    top = client.get('/persons/top?limit=3').get_json()['data']
+    assert [(person['id'], person['favourite_count']) for person in top] == [(4, 3), (2, 3), (6, 1)]
@@ -0,0 +1,41 @@
+import pytest
+
+# One SELECT per serialized level whatever the number of rows, the ETag's table_versions read aside
+EAGER_QUERY_COUNTS = {
+    '/users': 2, '/users/1': 2,
+    '/persons': 2, '/persons/1': 2,
+    '/planets': 3, '/planets/1': 3,
+    '/favourite/person': 1, '/favourite/planet': 1,
+}
+
+
+def data_queries(statements):
+    return [statement for statement in statements if 'table_versions' not in statement]
+
+
+@pytest.mark.parametrize('persons', [6, 300])
+@pytest.mark.parametrize('url', sorted(EAGER_QUERY_COUNTS))
+def test_query_count_does_not_grow_with_rows(client, seed, statements, url, persons):
+    seed(users=20, planets=3, persons=persons,
+         favourites=[{"user_id": i % 20 + 1, "person_id": i} for i in range(1, persons + 1)] +
+                    [{"user_id": i, "planet_id": i % 3 + 1} for i in range(1, 21)])
+    with statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert len(data_queries(statements)) == EAGER_QUERY_COUNTS[url]
+
+
+def test_planets_embed_persons_and_their_favourites(client, seed):
+    seed(users=2, planets=2, persons=4, favourites=[{"user_id": 1, "person_id": 2}, {"user_id": 2, "person_id": 2}])
+    planet = client.get('/planets/1').get_json()['planet']
+    assert [person['id'] for person in planet['persons']] == [2, 4]
+    assert [fav['user_id'] for fav in planet['persons'][0]['favourite_of']] == [1, 2]
+    assert planet['persons'][1]['favourite_of'] is None
+
+
+def test_sparse_fieldset_skips_the_relationship_query(client, seed, statements):
+    seed()
+    with statements:
+        response = client.get('/planets?fields=id,name')
+    assert response.get_json()['data'][0] == {"id": 1, "name": "planet 1"}
+    assert len(data_queries(statements)) == 1
@@ -0,0 +1,86 @@
+import logging
+
+import pytest
+from metrics import metrics
+from models import db, Users
+from utils import query_budget, QueryBudgetExceeded
+
+
+def with_budget(monkeypatch, app, endpoint, budget, view=None):
+    # The route's view, or another one, under a different budget
+    view = view or app.view_functions[endpoint].__wrapped__
+    monkeypatch.setitem(app.view_functions, endpoint, query_budget(budget)(view))
+
+
+def user_count(app):
+    with app.app_context():
+        return db.session.query(Users).count()
+
+
+def violations(endpoint):
+    values = metrics.counters.get(('query_budget_violations_total',
+                                   'Requests that ran more SQL statements than their route\'s budget.'), {})
+    return values.get((('endpoint', endpoint),), 0)
+
+
+def test_every_route_has_a_budget(app):
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static' or rule.rule.startswith('/admin'):
+            continue
+        assert getattr(app.view_functions[rule.endpoint], 'query_budget', None) is not None, rule.rule
+
+
+def test_write_over_budget_fails_before_its_commit(monkeypatch, app, client):
+    with_budget(monkeypatch, app, 'create_user', 1)
+    with pytest.raises(QueryBudgetExceeded, match="create_user ran 2 SQL statements, its query budget is 1"):
+        client.post('/users', json={'name': 'Luke'})
+    assert user_count(app) == 0
+
+
+def test_log_mode_counts_the_violation(monkeypatch, app, client, caplog):
+    app.config['QUERY_BUDGET_MODE'] = 'log'
+    with_budget(monkeypatch, app, 'create_user', 1)
+    before = violations('create_user')
+    with caplog.at_level(logging.WARNING):
+        assert client.post('/users', json={'name': 'Luke'}).status_code == 201
+    assert "its query budget is 1" in caplog.text
+    assert violations('create_user') == before + 1
+    assert user_count(app) == 1
+
+
+def test_off_mode_ignores_budgets(monkeypatch, app, client):
+    app.config['QUERY_BUDGET_MODE'] = 'off'
+    with_budget(monkeypatch, app, 'create_user', 0)
+    before = violations('create_user')
+    assert client.post('/users', json={'name': 'Luke'}).status_code == 201
+    assert violations('create_user') == before
+
+
+def test_violation_after_a_commit_is_reported_not_raised(monkeypatch, app, client, caplog):
+    def create_then_count():
+        db.session.add(Users(name='Luke'))
+        db.session.commit()
+        return {"users": db.session.query(Users).count()}, 201
+
+    with_budget(monkeypatch, app, 'create_user', 2, create_then_count)
+    before = violations('create_user')
+    with caplog.at_level(logging.WARNING):
+        assert client.post('/users', json={}).status_code == 201
+    assert "create_user ran 3 SQL statements" in caplog.text
+    assert violations('create_user') == before + 1
+    assert user_count(app) == 1
+
+
+def test_first_write_to_a_table_fits_the_budget(client, seed):
+    # table_versions has no row for favourite_persons yet: the version bump is still one statement
+    seed()
+    assert client.post('/favourite/person', json={'user_id': 1, 'person_id': 1}).status_code == 200
+
+
+def test_in_list_batches_are_charged_once(client, seed):
+    # 1200 persons load their favourites in three IN batches, within GET /persons' budget of 4
+    seed(users=10, planets=10, persons=1200,
+         favourites=[{"user_id": user, "person_id": person} for user in (1, 2) for person in range(1, 1201)])
+    response = client.get('/persons?limit=1000')
+    assert response.status_code == 200
+    assert len(response.get_json()['data']) == 1000
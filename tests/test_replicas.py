@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event
+from cache import cache
+from models import db, Persons, Users
+from replicas import replicas
+
+
+@pytest.fixture
+def replica(app, tmp_path):
+    """A replica bind on a second SQLite file, as init_app sets it up with DATABASE_REPLICA_URL.
+    sync() copies the primary over it; until then reads see what the replica held."""
+    path = str(tmp_path / 'replica.db')
+    engine = create_engine('sqlite:///' + path)
+    with app.app_context():
+        primary = db.engine.url.database
+        db.engines['replica'] = engine
+    replicas.watch(engine)
+    replicas.checked_at = replicas.down_until = 0
+    app.after_request_funcs.setdefault(None, []).append(replicas.after_request)
+
+    def sync():
+        source, target = sqlite3.connect(primary), sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+    sync.engine = engine
+    yield sync
+
+    app.after_request_funcs[None].remove(replicas.after_request)
+    event.remove(engine, "handle_error", replicas.on_error)
+    replicas.engine = None
+    with app.app_context():
+        del db.engines['replica']
+    engine.dispose()
+
+
+def rename_on_primary(app, id, name):
+    with app.app_context():
+        db.session.query(Persons).filter_by(id=id).update({'name': name})
+        db.session.commit()
+
+
+def test_reads_go_to_the_replica(app, client, seed, replica):
+    seed()
+    replica()
+    rename_on_primary(app, 1, 'Luke')
+    # Not yet replicated
+    assert client.get('/persons/1').get_json()['person']['name'] == 'person 1'
+    assert client.get('/persons').get_json()['data'][0]['name'] == 'person 1'
+
+
+def test_writes_go_to_the_primary(app, client, seed, replica):
+    seed()
+    replica()
+    assert client.post('/users', json={'name': 'Leia'}).status_code == 201
+    with app.app_context():
+        assert db.session.query(Users).count() == 4
+    with replica.engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT COUNT(*) FROM users").scalar() == 3
+
+
+def test_writer_reads_its_writes_from_the_primary(app, seed, replica):
+    seed()
+    replica()
+    writer, reader = app.test_client(), app.test_client()
+    assert reader.get('/persons/1').status_code == 200
+    # Rows read from the replica are never cached, they could be older than a writer's
+    assert cache.backend.get('persons:1') is None
+
+    response = writer.put('/persons/1', json={'name': 'Luke'})
+    assert 'db_primary=' in response.headers['Set-Cookie']
+    assert writer.get('/persons/1').get_json()['person']['name'] == 'Luke'
+    assert writer.get('/planets/2').get_json()['planet']['persons'][0]['name'] == 'Luke'
+    # Everyone else reads the replica
+    assert reader.get('/persons').get_json()['data'][0]['name'] == 'person 1'
+
+
+def test_failed_write_is_not_sticky(client, seed, replica):
+    seed()
+    replica()
+    response = client.put('/persons/1', json={'name': 'person 2'})
+    assert response.status_code == 400
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_reads_fall_back_to_the_primary_while_the_replica_is_down(app, client, seed, replica, tmp_path):
+    seed()
+    # A directory where the replica file should be: SQLite can't open it, the probe fails
+    (tmp_path / 'replica.db').mkdir()
+    rename_on_primary(app, 1, 'Luke')
+    assert client.get('/persons/1').get_json()['person']['name'] == 'Luke'
+    assert client.get('/diagnostics/db').get_json()['replica']['healthy'] is False
@@ -0,0 +1,60 @@
+import pytest
+
+# Status and body of each create route, as the API answered before the resource registry
+CREATED = [
+    ('/users', {'name': 'ann'}, 201,
+     {'msg': 'User created successfully', 'data': {'id': 4, 'name': 'ann', 'person_favourites': None}}),
+    ('/planets', {'name': 'hoth'}, 200,
+     {'msg': 'Planet created', 'data': {'id': 4, 'name': 'hoth', 'persons': None}}),
+    ('/persons', {'name': 'luke', 'planet_id': 1}, 201,
+     {'msg': 'Person created', 'data': {'id': 7, 'name': 'luke', 'planet_id': 1, 'favourite_of': None}}),
+    ('/favourite/person', {'user_id': 1, 'person_id': 1}, 200,
+     {'msg': 'Person created', 'data': {'id': 1, 'user_id': 1, 'person_id': 1}}),
+    ('/favourite/planet', {'user_id': 1, 'planet_id': 1}, 200,
+     {'msg': 'Fav Planet created', 'data': {'id': 1, 'user_id': 1, 'planet_id': 1}}),
+]
+
+
+@pytest.mark.parametrize('url, body, status, expected', CREATED)
+def test_create_answers_the_stored_row(client, seed, url, body, status, expected):
+    seed()
+    response = client.post(url, json=body)
+    assert (response.status_code, response.get_json()) == (status, expected)
+
+
+def test_create_answers_ids_with_their_column_type(client, seed):
+    seed()
+    client.get('/planets/2')
+    person = client.post('/persons', json={'name': 'luke', 'planet_id': '2'}).get_json()['data']
+    assert person['planet_id'] == 2
+    favourite = client.post('/favourite/planet', json={'user_id': '1', 'planet_id': '3'}).get_json()['data']
+    assert (favourite['user_id'], favourite['planet_id']) == (1, 3)
+    # The planet's cached payload went with the write
+    assert [person['name'] for person in client.get('/planets/2').get_json()['planet']['persons']] == \
+        ['person 1', 'person 4', 'luke']
+
+
+@pytest.mark.parametrize('url, body, message', [
+    ('/users', {'name': 'user 1'}, "This user already exists"),
+    ('/persons', {'name': 'han'}, "All fields are required"),
+    ('/persons', {'name': 'luke', 'planet_id': 99}, "Invalid planet_id"),
+    ('/favourite/person', {'user_id': 1, 'person_id': 99}, "este personaje no existe"),
+    ('/favourite/planet', {'user_id': 1, 'planet_id': 99}, "Este planeta no existe"),
+])
+def test_create_rejections(client, seed, url, body, message):
+    seed()
+    response = client.post(url, json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {'msg': message}
+
+
+def test_favourite_writes_stay_within_their_statements(client, seed, statements):
+    # INSERT, version upsert and counter UPDATE; a PUT moving the favourite adds the row read,
+    # the other counter and the read-back of the row
+    seed()
+    with statements:
+        assert client.post('/favourite/person', json={'user_id': 1, 'person_id': 2}).status_code == 200
+    assert len(statements) == 3
+    with statements:
+        assert client.put('/favourite/person/1', json={'person_id': 3}).status_code == 200
+    assert len(statements) == 6
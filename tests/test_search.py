@@ -0,0 +1,65 @@
+import search
+
+
+def names(client, q, **args):
+    response = client.get('/persons/search', query_string=dict(q=q, **args))
+    assert response.status_code == 200
+    return [person['name'] for person in response.get_json()['data']]
+
+
+def test_index_follows_inserts_updates_and_deletes(client, seed):
+    seed()
+    created = client.post('/persons', json={'name': 'Luke Skywalker', 'planet_id': 1}).get_json()['data']
+    client.post('/persons/bulk', json=[{'name': 'Anakin Skywalker', 'planet_id': 2}])
+    assert names(client, 'skywalker') == ['Luke Skywalker', 'Anakin Skywalker']
+
+    client.put('/persons/%d' % created['id'], json={'name': 'Luke Lars'})
+    assert names(client, 'skywalker') == ['Anakin Skywalker']
+    assert names(client, 'lars') == ['Luke Lars']
+
+    client.delete('/persons/%d' % created['id'])
+    assert names(client, 'luke') == []
+
+
+def test_rows_loaded_before_the_index_are_searchable(client, seed):
+    # seed() inserts with plain executemany, the triggers index them like any other insert
+    seed(persons=3)
+    assert names(client, 'person') == ['person 1', 'person 2', 'person 3']
+
+
+def test_prefix_matches_rank_first_then_shorter_names(client, seed):
+    seed(persons=0)
+    client.post('/persons/bulk', json=[{'name': name, 'planet_id': 1}
+                                       for name in ('Darth Vader', 'Vader', 'Vaderling', 'Lord Vader')])
+    assert names(client, 'VADER') == ['Vader', 'Vaderling', 'Lord Vader', 'Darth Vader']
+
+
+def test_search_pages_with_an_offset_cursor(client, seed):
+    seed(persons=5)
+    first = client.get('/persons/search?q=person&limit=2').get_json()
+    assert [person['name'] for person in first['data']] == ['person 1', 'person 2']
+    assert first['next_cursor'] == 2
+    second = client.get('/persons/search?q=person&limit=2&offset=4').get_json()
+    assert [person['name'] for person in second['data']] == ['person 5']
+    assert second['next_cursor'] is None
+
+
+def test_short_terms_are_rejected(client):
+    response = client.get('/planets/search?q=ab')
+    assert response.status_code == 400
+
+
+def test_broad_terms_rank_a_bounded_candidate_set(monkeypatch, client, seed):
+    # Each tier contributes its first SEARCH_CANDIDATES matches to the ranking, pages end there
+    monkeypatch.setattr(search, 'SEARCH_CANDIDATES', 3)
+    seed(persons=12)
+    client.post('/persons', json={'name': 'Darth person', 'planet_id': 1})
+    first = client.get('/persons/search?q=person&limit=2').get_json()
+    # The prefix tier reads ix_persons_name_lower in order: person 1, person 10, person 11
+    assert [person['name'] for person in first['data']] == ['person 1', 'person 10']
+    second = client.get('/persons/search?q=person&limit=2&offset=2').get_json()
+    assert [person['name'] for person in second['data']] == ['person 11']
+    assert second['next_cursor'] is None
+    # The substring tier ranks the first matches of the trigram index, by id
+    assert names(client, 'rson') == ['person 1', 'person 2', 'person 3']
+    assert names(client, 'darth') == ['Darth person']